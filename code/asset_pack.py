@@ -0,0 +1,148 @@
+import mmap
+import os
+import sys
+import pygame
+from assets import *
+from cache_file import *
+
+
+# A file of images that have already been decoded and scaled, so they can be used without loading them again: [DONE]
+# The sizes of the images depend on the resolution, so each resolution has its own pack.
+# It is created the first time the game is played, and updated whenever images that are not in it are loaded.
+# The pack is memory-mapped and the images use its memory directly, so they are not copied when the game starts.
+class AssetPack:
+    # Version 2 added whether the aspect ratio is protected to the keys of scaled images.
+    VERSION = 2
+
+    def __init__(self, resolution):
+        self.name = "pack_{}x{}".format(*resolution)
+        self.index_path = path.format(asset_cache_path, self.name + ".json")
+
+        # The pixel format that the images are stored in:
+        self.pixel_format = self.get_pixel_format()
+
+        # The name of the file containing the pixels, and the memory-mapped contents of it:
+        self.data_name = None
+        self.data = None
+        # How many times the pack has been saved, used to give each data file a different name:
+        self.save_count = 0
+
+        # A dictionary of image keys and lists of (offset, width, height) for the images in the data file:
+        self.entries = {}
+        # A dictionary of the paths and modification times of the files that the images were created from:
+        # If any of these files change, the images may be different, so the pack is not used.
+        self.sources = {}
+
+        # A dictionary of image keys and lists of images that have been added but are not saved in the pack yet:
+        # Images that are in the pack are not kept here, so that they are freed once nothing else uses them.
+        self.images = {}
+        # Whether images or sources have been added that are not saved in the pack yet:
+        self.modified = False
+
+        self.open()
+
+    @staticmethod
+    def get_pixel_format():
+        # Images in the same format as the screen can be drawn without being converted each time:
+        masks = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks()
+        if sys.byteorder == "little" and masks == (0xff0000, 0xff00, 0xff, 0xff000000): return "BGRA"
+        return "RGBA"
+
+    def open(self):
+        index = read_index(self.index_path, self.VERSION)
+        if index is None or index.get("format") != self.pixel_format: return
+
+        try:
+            with open(path.format(asset_cache_path, index["data"]), "rb") as data_file:
+                # Copy-on-write, so that drawing onto an image can never change the file:
+                self.data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return
+
+        self.data_name = index["data"]
+        self.save_count = index["save_count"]
+        self.entries = index["entries"]
+        self.sources = index["sources"]
+        self.remove_old_data_files()
+
+    def remove_old_data_files(self):
+        # Old data files cannot always be removed straight away, since they may still be in use:
+        for file_name in os.listdir(asset_cache_path):
+            if file_name.startswith(self.name + "_") and file_name != self.data_name:
+                try:
+                    os.remove(path.format(asset_cache_path, file_name))
+                except OSError:
+                    pass
+
+    def get(self, key):
+        # Returns the list of images with the key, or None if they are not in the pack:
+        # The images use the memory of the pack directly, so they are created again each time rather than kept,
+        # and callers keep the images that they still need.
+        images = self.images.get(key)
+
+        if images is None and key in self.entries:
+            data = memoryview(self.data)
+            images = [pygame.image.frombuffer(data[offset:offset + width * height * 4], (width, height),
+                                              self.pixel_format)
+                      if width * height > 0 else pygame.Surface((width, height), pygame.SRCALPHA)
+                      for offset, width, height in self.entries[key]]
+
+        return images
+
+    def add(self, key, images, sources=()):
+        # Adds a list of images that will be saved in the pack, along with the paths of the files they came from:
+        self.add_sources(sources)
+        if key in self.entries: return
+        self.images[key] = images
+        self.modified = True
+
+    def add_sources(self, sources):
+        for source in sources:
+            if source not in self.sources:
+                self.sources[source] = get_modification_time(source)
+                self.modified = True
+
+    def has_source(self, source):
+        # Returns whether images created from the file are in the pack:
+        return source in self.sources
+
+    def save(self):
+        # Writing a new pack containing all the images from the old one and any that have been added:
+        if not self.modified: return
+        os.makedirs(asset_cache_path, exist_ok=True)
+
+        self.save_count += 1
+        data_name = "{}_{}.bin".format(self.name, self.save_count)
+        entries = {}
+        offset = 0
+
+        with open(path.format(asset_cache_path, data_name), "wb") as data_file:
+            # Images that are already in the pack are copied as they are:
+            for key, key_entries in self.entries.items():
+                entries[key] = []
+                for old_offset, width, height in key_entries:
+                    data_file.write(self.data[old_offset:old_offset + width * height * 4])
+                    entries[key].append((offset, width, height))
+                    offset += width * height * 4
+
+            for key, images in self.images.items():
+                entries[key] = []
+                for image in images:
+                    width, height = image.get_size()
+                    data_file.write(pygame.image.tobytes(image, self.pixel_format))
+                    entries[key].append((offset, width, height))
+                    offset += width * height * 4
+
+        write_index(self.index_path, self.VERSION, {"format": self.pixel_format, "data": data_name,
+                                                    "save_count": self.save_count, "entries": entries,
+                                                    "sources": self.sources})
+
+        # Images that have already been used keep the memory of the old data file, so it is not closed:
+        with open(path.format(asset_cache_path, data_name), "rb") as data_file:
+            self.data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_COPY) if offset > 0 else None
+        self.data_name = data_name
+        self.entries = entries
+        # The added images are now in the pack, so they no longer need to be kept:
+        self.images.clear()
+        self.modified = False
+        self.remove_old_data_files()
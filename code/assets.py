@@ -4,6 +4,11 @@ path = "{}/{}"
 
 FONT = "../assets/fonts/metropolis_light"
 
+# Images that have already been loaded and resized are kept here, so that they can be used straight away:
+asset_cache_path = "../asset_cache"
+# Maps are also kept here after they have been compiled, so that they do not need to be parsed again:
+map_cache_path = "../asset_cache/maps"
+
 # ~!~ Images ~!~ #
 image_path = "../assets/images"
 
@@ -0,0 +1,155 @@
+import pygame
+import threading
+from assets import *
+
+
+# Decodes each sound effect once and plays the shared sounds for every character and item: [DONE]
+# The number of copies of each sound playing at once is limited, so that busy fights do not use up the mixer channels.
+class SoundBank:
+    # The sound effects that are decoded when the game starts:
+    SOUND_EFFECTS = [POTION_USE, WEAPON_USE, ITEM_PICKUP, PLAYER_DAMAGED, ENEMY_DAMAGED, ENEMY_DEATH]
+
+    # The number of mixer channels available for sound effects:
+    CHANNEL_COUNT = 16
+
+    # The maximum number of copies of a sound that can play at once:
+    MAX_VOICES = 3
+    # Sounds that many characters can make at the same time have lower limits:
+    VOICE_LIMITS = {ENEMY_DAMAGED: 2, ENEMY_DEATH: 2}
+
+    def __init__(self):
+        pygame.mixer.set_num_channels(self.CHANNEL_COUNT)
+
+        # A dictionary of sound paths and decoded sounds:
+        self.sounds = {}
+        for sound_path in self.SOUND_EFFECTS: self.get_sound(sound_path)
+
+        # The (channel, sound) pairs for the sounds started by the sound bank, from oldest to newest:
+        self.voices = []
+
+    def get_sound(self, sound_path):
+        # Sounds that were not decoded when the game started are decoded the first time they are needed:
+        if sound_path not in self.sounds: self.sounds[sound_path] = pygame.mixer.Sound(sound_path)
+        return self.sounds[sound_path]
+
+    def play(self, sound_path, volume=1):
+        sound = self.get_sound(sound_path)
+
+        # Forgetting about voices that have finished, or whose channels have been used for something else:
+        self.voices = [(channel, voice_sound) for channel, voice_sound in self.voices
+                       if channel.get_sound() is voice_sound]
+
+        same_sound_channels = [channel for channel, voice_sound in self.voices if voice_sound is sound]
+        if len(same_sound_channels) >= self.VOICE_LIMITS.get(sound_path, self.MAX_VOICES):
+            # If there are too many copies of the sound playing, the oldest copy is cut off to play the new one:
+            channel = same_sound_channels[0]
+        else:
+            channel = pygame.mixer.find_channel()
+            # If all channels are in use, the oldest sound effect is cut off to play the new one:
+            if channel is None and len(self.voices) > 0: channel = self.voices[0][0]
+
+        if channel is None: return None
+
+        self.voices = [voice for voice in self.voices if voice[0] is not channel]
+        channel.play(sound)
+        # The sound is shared, so the volume is set for the channel rather than the sound:
+        channel.set_volume(volume)
+        self.voices.append((channel, sound))
+        return channel
+
+
+# Plays music tracks, crossfading from one track to the next: [DONE]
+# Tracks are decoded on a separate thread, and can be decoded before they are needed,
+# so changing the music never holds up a frame.
+class MusicPlayer:
+    # The number of channels reserved for music - one fades out whilst the other fades in:
+    CHANNEL_COUNT = 2
+
+    # The maximum number of decoded tracks that are kept, since each one takes up a lot of memory:
+    MAX_TRACKS = 3
+
+    def __init__(self):
+        # Reserving the first channels so that sound effects are never played on them:
+        pygame.mixer.set_reserved(self.CHANNEL_COUNT)
+        self.channels = [pygame.mixer.Channel(index) for index in range(self.CHANNEL_COUNT)]
+        # The index of the channel the current track is played on:
+        self.channel_index = 0
+
+        # A dictionary of track paths and decoded tracks, from least to most recently used:
+        self.tracks = {}
+        # The paths of the tracks that are being decoded:
+        self.loading = set()
+        # Tracks are added by the decoding threads, so access to them needs to be synchronised:
+        self.lock = threading.Lock()
+
+        # The track that should be playing, the track that is actually playing,
+        # and how long the track that should be playing fades in for:
+        self.track_path = None
+        self.playing_track_path = None
+        self.fade_in = 0
+
+        self.volume = 1
+
+    def load(self, track_path):
+        # Decoding the whole track, which is slow, so this is run on a separate thread:
+        try:
+            track = pygame.mixer.Sound(track_path)
+        except (pygame.error, OSError):
+            # The track is missing or cannot be decoded, so nothing is played.
+            # It is no longer loading, so that it is decoded again the next time it is played:
+            track = None
+
+        with self.lock:
+            self.loading.discard(track_path)
+            if track is None: return
+            self.tracks[track_path] = track
+            self.remove_old_tracks()
+
+    def prefetch(self, track_path):
+        # Starts decoding a track so that it can be played straight away later:
+        with self.lock:
+            if track_path in self.tracks or track_path in self.loading: return
+            self.loading.add(track_path)
+
+        threading.Thread(target=self.load, args=(track_path,), daemon=True).start()
+
+    def remove_old_tracks(self):
+        # Removing the least recently used tracks that are not needed, until there are not too many:
+        for track_path in list(self.tracks.keys()):
+            if len(self.tracks) <= self.MAX_TRACKS: return
+            if track_path not in (self.track_path, self.playing_track_path): del self.tracks[track_path]
+
+    def play(self, track_path, fade_out=1000, fade_in=1000):
+        # The track that is already playing keeps playing, unless it could not be decoded, in which case it is retried:
+        with self.lock:
+            if track_path == self.track_path and (track_path in self.tracks or track_path in self.loading): return
+
+        # Fading out the current track, the new track fades in on the other channel once it is ready:
+        self.channels[self.channel_index].fadeout(fade_out)
+        self.playing_track_path = None
+        self.track_path = track_path
+        self.fade_in = fade_in
+
+        self.prefetch(track_path)
+        self.update()
+
+    def update(self):
+        # Must be called every frame, so that a track is started as soon as it has been decoded:
+        if self.track_path is None or self.track_path == self.playing_track_path: return
+
+        with self.lock:
+            track = self.tracks.get(self.track_path)
+            if track is None: return
+            # Marking the track as the most recently used:
+            self.tracks[self.track_path] = self.tracks.pop(self.track_path)
+
+        self.channel_index = (self.channel_index + 1) % self.CHANNEL_COUNT
+        channel = self.channels[self.channel_index]
+        # The volume is set first, since the track fades in up to the volume of the channel:
+        channel.set_volume(self.volume)
+        channel.play(track, loops=-1, fade_ms=self.fade_in)
+        self.playing_track_path = self.track_path
+
+    def set_volume(self, volume):
+        self.volume = volume
+        self.channels[self.channel_index].set_volume(volume)
@@ -0,0 +1,35 @@
+import json
+import os
+
+
+# Reads and writes the index files of caches, such as the asset pack and compiled maps: [DONE]
+# Each index has the version of the cache and the modification times of the files the cache was created from.
+# Caches with a different version are ignored, so that changes to their format do not break the game,
+# and caches created from files that have since changed are ignored, as their contents would be out of date.
+
+
+def get_modification_time(source):
+    return os.path.getmtime(source)
+
+
+# Returns the index at the path, or None if it cannot be read, has a different version or is out of date:
+def read_index(index_path, version):
+    try:
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("version") != version: return None
+
+    for source, modification_time in index.get("sources", {}).items():
+        if not os.path.exists(source) or get_modification_time(source) != modification_time: return None
+
+    return index
+
+
+# The index is replaced in one step, so that it never refers to cache files that have not been written:
+def write_index(index_path, version, index):
+    with open(index_path + ".tmp", "w") as index_file:
+        json.dump(dict(index, version=version), index_file)
+    os.replace(index_path + ".tmp", index_path)
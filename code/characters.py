@@ -1,8 +1,64 @@
 import pygame.image
 from tile import Tile
+from texture_atlas import pack_images
 from user_interface import *
 
 
+# Animations shared between all characters that use the same animation folder and size:
+# Characters of the same type all have identical animations, so the images only need to be loaded and resized once.
+# Each animation is only loaded the first time a character uses it, since many are rarely used,
+# such as enemies that die before attacking. Animations that have not been used recently are removed
+# once the frames take up too much memory, and are loaded again if they are needed.
+class AnimationCache:
+    # The most memory that the frames of the animations that are kept can take up, in bytes:
+    MAX_BYTES = 16 * 1024 * 1024
+
+    # A dictionary of (animation folder path, size) and the frames of the animation, from least to most recently used:
+    animations = {}
+    # How much memory the frames take up, in bytes:
+    byte_count = 0
+
+    @classmethod
+    def get_frames(cls, asset_pack, folder_path, size):
+        key = (folder_path, tuple(size))
+
+        # Moving the animation to the end, since it is now the most recently used:
+        frames = cls.animations.pop(key, None)
+        if frames is None:
+            frames = cls.load_frames(asset_pack, folder_path, size)
+            cls.byte_count += cls.get_byte_count(frames)
+            cls.animations[key] = frames
+            cls.remove_old_animations()
+        else:
+            cls.animations[key] = frames
+
+        return frames
+
+    @staticmethod
+    def load_frames(asset_pack, folder_path, size):
+        # Taking the resized images from the asset pack if they are in it, otherwise adding them to it:
+        # Frames from the pack already use its memory, which is shared rather than copied:
+        pack_key = "animation:{}:{}".format(folder_path, tuple(size))
+        frames = asset_pack.get(pack_key)
+        if frames is None:
+            # Otherwise, the frames are packed into one surface, which is freed when the animation is removed:
+            frames = pack_images([resize_image(image, size) for image in import_images(folder_path)])
+            asset_pack.add(pack_key, frames, get_image_paths(folder_path))
+        return frames
+
+    @staticmethod
+    def get_byte_count(frames):
+        return sum(frame.get_width() * frame.get_height() * 4 for frame in frames)
+
+    @classmethod
+    def remove_old_animations(cls):
+        # Removing the least recently used animations until the frames do not take up too much memory,
+        # apart from the one that was used last, which is about to be shown:
+        for key in list(cls.animations.keys())[:-1]:
+            if cls.byte_count <= cls.MAX_BYTES: return
+            cls.byte_count -= cls.get_byte_count(cls.animations.pop(key))
+
+
 class Character(Tile):  # [TESTED & FINALISED]
     # Default speed of game characters in tiles per second:
     BASE_SPEED = 5
@@ -49,8 +105,8 @@ class Character(Tile):  # [TESTED & FINALISED]
         # For each item in the inventory, setting the owner as the character:
         for item in self.inventory: item.set_owner(self)
 
-        # The sound to be played when the character is damaged:
-        self.damaged_sound = pygame.mixer.Sound(WEAPON_USE)
+        # The sound to be played when the character is damaged (sounds are played by the sound bank of the game):
+        self.damaged_sound = WEAPON_USE
         self.damaged_sound_start_time = 0
         self.damaged_sound_can_be_played = True
 
@@ -66,32 +122,19 @@ class Character(Tile):  # [TESTED & FINALISED]
         # For this reason, storing this value and adding it to the distance each frame:
         self.displacement_deficit = [0, 0]
 
-        # Animations:
-        self.animations = None
+        # Animations, where the name of each folder in the animation path is an animation status:
         self.animation_path = animation_path
         self.animation_status = self.DOWN_IDLE
         self.animation_increment_time = 0
         self.current_animation_frame_index = 0
-        self.import_animations()
         # How long each animation frame should take:
         self.animation_frame_time = 150 / self.stats[self.SPEED_MULTIPLIER]
 
-    def import_animations(self):
-        # A dictionary of animation folder names and lists of images in the folders:
-        self.animations = {
-            # Walking
-            self.UP_MOVE: [], self.DOWN_MOVE: [], self.LEFT_MOVE: [], self.RIGHT_MOVE: [],
-            # Stopping
-            self.UP_IDLE: [], self.DOWN_IDLE: [], self.LEFT_IDLE: [], self.RIGHT_IDLE: [],
-            # Attacking
-            self.UP_USE: [], self.DOWN_USE: [], self.LEFT_USE: [], self.RIGHT_USE: []
-        }
-
-        # Filling the dictionary:
-        for folder_name in self.animations.keys():
-            final_path = self.animation_path + "/" + folder_name
-            # Max size inherited from parent:
-            self.animations[folder_name] = [resize_image(image, self.max_size) for image in import_images(final_path)]
+    def get_animation_frames(self):
+        # The frames of the current animation, which are shared with other characters using the same animations,
+        # so the list must not be modified. The frames are only loaded the first time the animation is used:
+        return AnimationCache.get_frames(self.game.get_asset_pack(), self.animation_path + "/" + self.animation_status,
+                                         self.max_size)
 
     def update_animation_status(self):
         # Setting the animation status according to the character's direction:
@@ -117,9 +160,9 @@ class Character(Tile):  # [TESTED & FINALISED]
         return self.animation_status
 
     def update_animation_frame(self):
-        current_time = pygame.time.get_ticks()
+        current_time = self.game.get_simulation_time()
 
-        animation_frames = self.animations[self.animation_status]
+        animation_frames = self.get_animation_frames()
 
         # If the current time is greater than the time the animation frame was last updated,
         # and the duration each animation frame should last, updating the animation frame:
@@ -134,6 +177,8 @@ class Character(Tile):  # [TESTED & FINALISED]
             # Adjusting the collider according to the size of the new animation frame:
             self.rect.size = self.image.get_size()
             self.adjust_collider()
+            # The size of the rectangle may have changed, so keeping the spatial grids of the level up to date:
+            self.level.move_tile(self)
 
     def set_use_animation(self):
         # Converting the animation status to using item:
@@ -191,18 +236,18 @@ class Character(Tile):  # [TESTED & FINALISED]
         # Measuring the difference in ticks to calculate time.
         # Alternatively, it is possible to do it by counting frames and multiplying by frame time:
 
-        current_time = pygame.time.get_ticks()
+        current_time = self.game.get_simulation_time()
 
         # Character can only play damage sound after a cooldown:
         if current_time - self.damaged_sound_start_time >= self.DAMAGED_SOUND_COOLDOWN:
             self.damaged_sound_can_be_played = True
 
-    def handle_collision(self, axis):
+    def handle_collision(self, axis, obstacle_sprites=None):
         # A flag that can be used to test if a collision has occurred:
         collision_detected = False
 
-        # Retrieving the collision objects:
-        obstacle_sprites = self.level.get_obstacle_tiles_in_frame().copy()
+        # Retrieving the collision objects, which are the obstacles near the character unless they are provided:
+        if obstacle_sprites is None: obstacle_sprites = self.level.get_obstacle_tiles_near(self.collider)
 
         # Cannot collide with itself:
         if self in obstacle_sprites: obstacle_sprites.remove(self)
@@ -213,6 +258,10 @@ class Character(Tile):  # [TESTED & FINALISED]
                 obstacle_collider = obstacle.get_collider()
                 # Checking if the obstacle has collided with the character:
                 if obstacle_collider.colliderect(self.collider):
+                    # For obstacles with masks, only the opaque pixels that the character overlaps are collided with:
+                    if obstacle.get_mask() is not None:
+                        obstacle_collider = self.get_mask_overlap(obstacle)
+                        if obstacle_collider is None: continue
                     collision_detected = True
                     # Using the character's direction to handle collision:
                     if self.direction.x > 0:
@@ -227,6 +276,10 @@ class Character(Tile):  # [TESTED & FINALISED]
                 obstacle_collider = obstacle.get_collider()
                 # Checking if the obstacle has collided with the character:
                 if obstacle_collider.colliderect(self.collider):
+                    # For obstacles with masks, only the opaque pixels that the character overlaps are collided with:
+                    if obstacle.get_mask() is not None:
+                        obstacle_collider = self.get_mask_overlap(obstacle)
+                        if obstacle_collider is None: continue
                     collision_detected = True
                     # Using the character's direction to handle collision:
                     if self.direction.y > 0:
@@ -238,6 +291,56 @@ class Character(Tile):  # [TESTED & FINALISED]
 
         return collision_detected
 
+    def get_mask_overlap(self, obstacle):
+        # Returns the rectangle around the opaque pixels of the obstacle that the collider of the character overlaps,
+        # or None if it does not overlap any of them.
+        # Only called once the colliders are known to overlap, since checking the mask is slower:
+        obstacle_collider = obstacle.get_collider()
+        offset = (self.collider.x - obstacle_collider.x, self.collider.y - obstacle_collider.y)
+        collider_mask = get_filled_mask(self.collider.size)
+        if obstacle.get_mask().overlap(collider_mask, offset) is None: return None
+
+        overlap_rects = obstacle.get_mask().overlap_mask(collider_mask, offset).get_bounding_rects()
+        return overlap_rects[0].unionall(overlap_rects[1:]).move(obstacle_collider.topleft)
+
+    def sweep(self, axis, displacement, obstacle_sprites):
+        # Returns how far the character can move along the axis before it hits an obstacle,
+        # so that it cannot pass through thin obstacles however far it moves in one frame.
+        # Since each axis is moved separately, the character then slides along the obstacle:
+        if displacement == 0: return 0
+
+        if axis == 0:
+            start, end, low, high = self.collider.left, self.collider.right, self.collider.top, self.collider.bottom
+        else:
+            start, end, low, high = self.collider.top, self.collider.bottom, self.collider.left, self.collider.right
+
+        for obstacle in obstacle_sprites:
+            obstacle_collider = obstacle.get_collider()
+            # Like with colliderect, the character cannot collide with itself or with colliders without an area:
+            if obstacle is self or obstacle_collider.width <= 0 or obstacle_collider.height <= 0: continue
+            # Obstacles with masks are smaller than their colliders, so the character moves into their colliders
+            # and handle_collision moves it back out of their opaque pixels:
+            if obstacle.get_mask() is not None: continue
+
+            if axis == 0:
+                obstacle_start, obstacle_end = obstacle_collider.left, obstacle_collider.right
+                obstacle_low, obstacle_high = obstacle_collider.top, obstacle_collider.bottom
+            else:
+                obstacle_start, obstacle_end = obstacle_collider.top, obstacle_collider.bottom
+                obstacle_low, obstacle_high = obstacle_collider.left, obstacle_collider.right
+
+            # Only obstacles that are level with the character on the other axis can be hit:
+            if obstacle_low >= high or obstacle_high <= low: continue
+
+            # Stopping at the first obstacle ahead of the character.
+            # Obstacles that the character is already overlapping are handled by handle_collision:
+            if displacement > 0 and obstacle_start >= end:
+                displacement = min(displacement, obstacle_start - end)
+            elif displacement < 0 and obstacle_end <= start:
+                displacement = max(displacement, obstacle_end - start)
+
+        return displacement
+
     def add_health(self, health_value):
         # Increases the character's health by the specified amount, to not exceed the maximum health:
         self.stats[self.CURRENT_HEALTH] += health_value
@@ -248,9 +351,8 @@ class Character(Tile):  # [TESTED & FINALISED]
 
         # Playing damage sound:
         if self.damaged_sound_can_be_played:
-            self.damaged_sound_start_time = pygame.time.get_ticks()
-            self.damaged_sound.set_volume(self.game.get_audio_volume())
-            self.damaged_sound.play()
+            self.damaged_sound_start_time = self.game.get_simulation_time()
+            self.game.play_sound(self.damaged_sound)
             self.damaged_sound_can_be_played = False
 
         # Reducing current health:
@@ -267,6 +369,32 @@ class Character(Tile):  # [TESTED & FINALISED]
     def get_rect(self):
         return self.rect
 
+    def get_state(self):
+        # Adding the stats, inventory, movement and animation of the character:
+        state = super().get_state()
+        state.update({"stats": dict(self.stats), "inventory": dict(self.inventory), "item_held": self.item_held,
+                      "direction": self.direction.copy(), "displacement_deficit": list(self.displacement_deficit),
+                      "animation_status": self.animation_status,
+                      "animation_increment_time": self.animation_increment_time,
+                      "current_animation_frame_index": self.current_animation_frame_index,
+                      "damaged_sound_start_time": self.damaged_sound_start_time,
+                      "damaged_sound_can_be_played": self.damaged_sound_can_be_played})
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        # Copying the stats and inventory, so that the state can be restored again:
+        self.stats = dict(state["stats"])
+        self.inventory = dict(state["inventory"])
+        self.item_held = state["item_held"]
+        self.direction = state["direction"].copy()
+        self.displacement_deficit = list(state["displacement_deficit"])
+        self.animation_status = state["animation_status"]
+        self.animation_increment_time = state["animation_increment_time"]
+        self.current_animation_frame_index = state["current_animation_frame_index"]
+        self.damaged_sound_start_time = state["damaged_sound_start_time"]
+        self.damaged_sound_can_be_played = state["damaged_sound_can_be_played"]
+
     def get_stats(self):
         return self.stats
 
@@ -294,16 +422,23 @@ class Character(Tile):  # [TESTED & FINALISED]
         self.displacement_deficit = [displacement_required[0] - displacement_possible[0],
                                      displacement_required[1] - displacement_possible[1]]
 
+        # The only obstacles the character can collide with are those within the area it moves through:
+        swept_rect = self.collider.union(self.collider.move(displacement_possible))
+        obstacle_sprites = self.level.get_obstacle_tiles_near(swept_rect)
+
         # Moving the player with horizontal and vertical components separately,
-        # so that we know which side the player is colliding on:
-        self.collider.x += displacement_possible[0]
-        self.handle_collision(0)
+        # so that we know which side the player is colliding on.
+        # Each movement stops at the first obstacle in the way, and any overlap remaining from before is resolved:
+        self.collider.x += self.sweep(0, displacement_possible[0], obstacle_sprites)
+        self.handle_collision(0, obstacle_sprites)
 
-        self.collider.y += displacement_possible[1]
-        self.handle_collision(1)
+        self.collider.y += self.sweep(1, displacement_possible[1], obstacle_sprites)
+        self.handle_collision(1, obstacle_sprites)
 
         # Centering the rectangle image of the player to where the collider has just been moved:
         self.rect.center = self.collider.center
+        # Keeping the spatial grids of the level up to date:
+        self.level.move_tile(self)
 
     def update(self):
         self.update_cooldown_timers()
@@ -311,6 +446,11 @@ class Character(Tile):  # [TESTED & FINALISED]
         self.update_animation_frame()
         self.item_held.update()
 
+    def draw_overlay(self):
+        # Drawing the item held on top of the map if it is being used:
+        if self.item_held.is_in_use():
+            self.item_held.draw(self.level.get_draw_offset())
+
 
 class Player(Character):  # [TESTED & FINALISED]
     STEALTH_MULTIPLIER = 4
@@ -323,8 +463,8 @@ class Player(Character):  # [TESTED & FINALISED]
         super().__init__(game, stats, inventory, self.ANIMATION_PATH, position=position)
 
         # Sounds:
-        self.damaged_sound = pygame.mixer.Sound(PLAYER_DAMAGED)
-        self.item_pickup_sound = pygame.mixer.Sound(ITEM_PICKUP)
+        self.damaged_sound = PLAYER_DAMAGED
+        self.item_pickup_sound = ITEM_PICKUP
 
     def handle_input(self):
         # Player cannot move if an item is in use:
@@ -357,23 +497,15 @@ class Player(Character):  # [TESTED & FINALISED]
         if self.direction.magnitude() != 0:
             self.direction = self.direction.normalize()
 
-        # Using item if space is pressed, using item:
-        if self.game.key_pressed(pygame.K_SPACE):
-            self.use_item()
-
-    def handle_item_collision(self):
-        # Checking collision with item tiles in frame, and adding them to the inventory if there is a collision:
-        for item in self.level.get_item_tiles_in_frame():
-            if item.get_collider().colliderect(self.collider):
-                self.pick_up_item(item)
+        # The item is used with the space key in the game loop rather than here,
+        # since a frame may have no simulation steps, in which case the key press would be missed.
 
     def pick_up_item(self, item):
         # Removing the item from the ground and setting player as the owner:
         item.set_owner(self)
 
         # Playing sound:
-        self.item_pickup_sound.set_volume(self.game.get_audio_volume())
-        self.item_pickup_sound.play()
+        self.game.play_sound(self.item_pickup_sound)
 
         # Determining if there is an identical item in the inventory:
         item_in_inventory = self.get_item_by_name(item.get_name())
@@ -398,6 +530,25 @@ class Player(Character):  # [TESTED & FINALISED]
             # Setting the item held as the Knight's Sword:
             self.item_held = self.get_item_by_name(KNIGHT_SWORD)
 
+    def set_state(self, state):
+        # The stats and inventory of the player are saved when the level is restarted, so they are kept,
+        # in the same way as when the player is loaded from the database:
+        stats, inventory = self.stats, self.inventory
+        super().set_state(state)
+        self.stats = stats
+        self.stats[self.CURRENT_HEALTH] = self.stats[self.FULL_HEALTH]
+
+        # Items that have been picked up since the state was recorded are put back where they were,
+        # so the player is given new items of the same type instead:
+        self.inventory = {}
+        for item, quantity in inventory.items():
+            if item not in state["inventory"]:
+                item = Utils().get_item(self.game, item.get_name())
+                item.set_owner(self)
+            self.inventory[item] = quantity
+
+        self.item_held = list(self.inventory)[0]
+
     def death_sequence(self):
         # Restoring health back to full:
         self.stats[self.CURRENT_HEALTH] = self.stats[self.FULL_HEALTH]
@@ -410,7 +561,8 @@ class Player(Character):  # [TESTED & FINALISED]
     def update(self):
         super().update()
         self.handle_input()
-        self.handle_item_collision()
+        # Picking up any items that the player has walked into, and showing the quest board if it is close enough:
+        self.level.update_triggers(self)
         self.move(self.BASE_SPEED * self.stats[self.SPEED_MULTIPLIER])
 
 
@@ -441,10 +593,10 @@ class Enemy(Character):  # [TESTED & FINALISED]
         self.recovery_start_time = 0
 
         # Sound to be played upon taking damage:
-        self.damaged_sound = pygame.mixer.Sound(ENEMY_DAMAGED)
+        self.damaged_sound = ENEMY_DAMAGED
 
         # Sound played by enemy upon death:
-        self.death_sound = pygame.mixer.Sound(ENEMY_DEATH)
+        self.death_sound = ENEMY_DEATH
 
         # The health bar above the enemy's head:
         self.health_bar = ProgressBar(self.game, font_size=0.02,
@@ -468,10 +620,21 @@ class Enemy(Character):  # [TESTED & FINALISED]
     def update_cooldown_timers(self):
         super().update_cooldown_timers()
         # Also updating recovery cooldown:
-        current_time = pygame.time.get_ticks()
+        current_time = self.game.get_simulation_time()
         if current_time - self.recovery_start_time >= self.stats[self.RECOVERY_DURATION]:
             self.in_recovery = False
 
+    def get_state(self):
+        # Adding the recovery of the enemy:
+        state = super().get_state()
+        state.update({"in_recovery": self.in_recovery, "recovery_start_time": self.recovery_start_time})
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.in_recovery = state["in_recovery"]
+        self.recovery_start_time = state["recovery_start_time"]
+
     def death_sequence(self):
         for item in self.inventory:
             # Obtaining the chance that the item gets dropped:
@@ -481,8 +644,7 @@ class Enemy(Character):  # [TESTED & FINALISED]
                 item.set_owner(None)
 
         # Playing death sound:
-        self.death_sound.set_volume(self.game.get_audio_volume())
-        self.death_sound.play()
+        self.game.play_sound(self.death_sound)
 
         # Removing the enemy itself from the level:
         self.game.get_current_level().remove_tile(self)
@@ -491,9 +653,13 @@ class Enemy(Character):  # [TESTED & FINALISED]
         # Enemy cannot use the item if it is currently in recovery:
         if self.in_recovery: return
         super().use_item()
-        self.recovery_start_time = pygame.time.get_ticks()
+        self.recovery_start_time = self.game.get_simulation_time()
         self.in_recovery = True
 
+    def draw_overlay(self):
+        super().draw_overlay()
+        self.update_views()
+
     def update_views(self):
         # Setting health bar progress according to enemy health:
         self.health_bar.set_progress(self.stats[self.CURRENT_HEALTH] / self.stats[self.FULL_HEALTH])
@@ -532,6 +698,5 @@ class Enemy(Character):  # [TESTED & FINALISED]
     def update(self):
         super().update()
         self.ai()
-        self.update_views()
         self.move(self.BASE_SPEED * self.stats[self.SPEED_MULTIPLIER])
 
@@ -0,0 +1,173 @@
+import os
+from xml.etree import ElementTree
+import numpy as np
+from pytmx import TiledTileLayer, TiledObjectGroup
+from pytmx.util_pygame import load_pygame, pygame_image_loader
+from assets import *
+from cache_file import *
+
+
+# A tile layer of a compiled map, with the gid of the tile at each position:
+class CompiledTileLayer:
+
+    def __init__(self, name, gids):
+        self.name = name
+        # A 2D array of gids, by row then column:
+        self.gids = gids
+
+    def iter_data(self):
+        # Returns the (x, y, gid) of each position with a tile, in the same order as pytmx:
+        rows, columns = np.nonzero(self.gids)
+        return zip(columns.tolist(), rows.tolist(), self.gids[rows, columns].tolist())
+
+
+# An object layer of a compiled map, with the (x, y, width, height, gid) of each object that has an image:
+class CompiledObjectLayer:
+
+    def __init__(self, name, objects):
+        self.name = name
+        # A 2D array with a row for each object:
+        self.objects = objects
+
+    def __iter__(self):
+        for x, y, width, height, gid in self.objects.tolist(): yield x, y, width, height, int(gid)
+
+
+# The parts of a Tiled map that levels use, kept in a compact cache so that the map only needs to be parsed once:
+# The cache contains the gids of each tile layer and the objects of each object layer as arrays,
+# and a manifest with the layers, the image file of each gid and the files the map was compiled from.
+# If any of those files change, the map is compiled again.
+# Tile images are only loaded when they are needed, which is rarely since scaled images are kept in the asset pack.
+class CompiledMap:
+    VERSION = 1
+
+    TILES = "tiles"
+    OBJECTS = "objects"
+
+    def __init__(self, map_path):
+        self.map_path = map_path
+
+        # The cache files are named after the map file:
+        cache_name = "".join(character if character.isalnum() else "_" for character in os.path.normpath(map_path))
+        self.manifest_path = path.format(map_cache_path, cache_name.strip("_") + ".json")
+        self.arrays_path = path.format(map_cache_path, cache_name.strip("_") + ".npz")
+
+        # The size of the map in tiles:
+        self.width = 0
+        self.height = 0
+
+        # A dictionary of the names and the visible layers of the map:
+        self.layers = {}
+
+        # A dictionary of gids and the (image file path, colour key) of their images:
+        self.tile_images = {}
+        # A dictionary of gids and their images that have been loaded:
+        self.images = {}
+
+        # A dictionary of the paths and modification times of the files the map was compiled from:
+        self.sources = {}
+
+        if not self.load(): self.compile()
+
+    def load(self):
+        # Returns whether the map could be loaded from the cache:
+        manifest = read_index(self.manifest_path, self.VERSION)
+        if manifest is None: return False
+
+        try:
+            arrays = np.load(self.arrays_path, allow_pickle=False)
+        except (OSError, ValueError):
+            return False
+
+        with arrays:
+            for index, (name, layer_type) in enumerate(manifest["layers"]):
+                if layer_type == self.TILES: self.layers[name] = CompiledTileLayer(name, arrays[str(index)])
+                else: self.layers[name] = CompiledObjectLayer(name, arrays[str(index)])
+
+        self.width = manifest["width"]
+        self.height = manifest["height"]
+        self.tile_images = {int(gid): tuple(tile_image) for gid, tile_image in manifest["tile_images"].items()}
+        self.sources = manifest["sources"]
+        return True
+
+    def compile(self):
+        # Parsing the map with pytmx, which also loads every tile image:
+        tmx_data = load_pygame(self.map_path)
+        map_folder = os.path.dirname(self.map_path)
+
+        self.width = tmx_data.width
+        self.height = tmx_data.height
+
+        for layer in tmx_data.visible_layers:
+            if isinstance(layer, TiledTileLayer):
+                self.layers[layer.name] = CompiledTileLayer(layer.name, np.array(layer.data, dtype=np.uint32))
+            elif isinstance(layer, TiledObjectGroup):
+                # Only objects with images are used:
+                objects = [(map_object.x, map_object.y, map_object.width, map_object.height, map_object.gid)
+                           for map_object in layer if map_object.image is not None]
+                self.layers[layer.name] = CompiledObjectLayer(layer.name,
+                                                              np.array(objects, dtype=np.float64).reshape(-1, 5))
+
+        # The images that pytmx has already loaded can be used this time:
+        for gid, image in enumerate(tmx_data.images):
+            if image is None: continue
+            self.images[gid] = image
+            properties = tmx_data.get_tile_properties_by_gid(gid) or {}
+            if properties.get("source"):
+                self.tile_images[gid] = (os.path.normpath(os.path.join(map_folder, properties["source"])),
+                                         properties.get("trans"))
+
+        # The tilesets of the map are in separate files, which also affect the map:
+        tileset_paths = [os.path.normpath(os.path.join(map_folder, node.get("source")))
+                         for node in ElementTree.parse(self.map_path).getroot().iter("tileset") if node.get("source")]
+        for source in [self.map_path] + tileset_paths + [image_path for image_path, _ in self.tile_images.values()]:
+            self.sources[source] = get_modification_time(source)
+
+        # The map can only be cached if each image is a whole file that has not been flipped or rotated,
+        # since otherwise pytmx would need to cut out or transform the image:
+        flipped = any(flags and any(flags) for _, flags in tmx_data.imagemap)
+        if not flipped and len(self.tile_images) == len(self.images): self.save()
+
+    def save(self):
+        os.makedirs(map_cache_path, exist_ok=True)
+
+        layers = list(self.layers.values())
+        np.savez_compressed(self.arrays_path, **{str(index): layer.gids if isinstance(layer, CompiledTileLayer)
+                                                 else layer.objects for index, layer in enumerate(layers)})
+
+        manifest = {"width": self.width, "height": self.height,
+                    "layers": [(layer.name, self.TILES if isinstance(layer, CompiledTileLayer) else self.OBJECTS)
+                               for layer in layers],
+                    "tile_images": self.tile_images, "sources": self.sources}
+        # The manifest is written last, so that it never refers to arrays that have not been written:
+        write_index(self.manifest_path, self.VERSION, manifest)
+
+    def get_layer(self, layer_name):
+        # Returns the visible layer with the name, or None if there is not one:
+        return self.layers.get(layer_name)
+
+    def get_gids(self):
+        # Returns the gids used by the visible layers of the map:
+        gids = set()
+        for layer in self.layers.values():
+            if isinstance(layer, CompiledTileLayer): gids.update(np.unique(layer.gids).tolist())
+            else: gids.update(int(gid) for gid in layer.objects[:, 4].tolist())
+        # A gid of 0 means that there is no tile:
+        gids.discard(0)
+        return gids
+
+    def get_tile_image(self, gid):
+        # Loading the image the first time it is needed, in the same way as pytmx:
+        if gid not in self.images:
+            image_path, colour_key = self.tile_images[gid]
+            self.images[gid] = pygame_image_loader(image_path, colour_key)()
+        return self.images[gid]
+
+    def get_tile_image_loader(self, gid):
+        # Returns a function that returns the image of the gid, or None if the gid does not have an image:
+        if gid not in self.images and gid not in self.tile_images: return None
+        return lambda: self.get_tile_image(gid)
+
+    def get_source_paths(self):
+        # The paths of the files that the map was compiled from:
+        return list(self.sources.keys())
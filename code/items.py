@@ -2,6 +2,38 @@ from characters import *
 import pygame.transform
 from strings import *
 from assets import *
+from texture_atlas import TextureAtlas
+
+
+# Item images shared between all items that use the same image folder and size:
+# Every item of the same type has identical images, so they only need to be loaded and resized once,
+# and items can be created or dropped without reading any files.
+class ItemImageRegistry:
+    # A dictionary of (image path, size, file names) and dictionaries of file names and images:
+    images = {}
+    # Images from the asset pack already share the memory of the pack, so they are used as they are.
+    # Only images resized for the first time, which happens on the first run at a resolution, are packed into
+    # the same few surfaces. These are kept for the rest of that session, and come from the pack afterwards:
+    atlas = TextureAtlas()
+
+    @classmethod
+    def get_images(cls, asset_pack, image_path, size, file_names):
+        key = (image_path, tuple(size), tuple(file_names))
+
+        if key not in cls.images:
+            cls.images[key] = {}
+
+            for file_name in file_names:
+                file_path = path.format(image_path, file_name)
+                # Taking the resized image from the asset pack if it is in it, otherwise adding it to it:
+                pack_key = "item:{}:{}".format(file_path, tuple(size))
+                images = asset_pack.get(pack_key)
+                if images is None:
+                    images = [cls.atlas.add(resize_image(pygame.image.load(file_path).convert_alpha(), size))]
+                    asset_pack.add(pack_key, images, [file_path])
+                cls.images[key][file_name] = images[0]
+
+        return cls.images[key]
 
 
 class Item(Tile):  # [TESTED & FINALISED]
@@ -20,8 +52,8 @@ class Item(Tile):  # [TESTED & FINALISED]
         self.use_start_time = 0
         self.use_duration = use_duration
 
-        # Sound effects for using item:
-        self.use_sound = pygame.mixer.Sound(use_sound_path)
+        # Sound effects for using item (sounds are played by the sound bank of the game):
+        self.use_sound = use_sound_path
 
         # The path to the folder containing the images:
         self.image_path = image_path
@@ -29,7 +61,8 @@ class Item(Tile):  # [TESTED & FINALISED]
         self.images = {}
         # Filling image dictionary:
         self.import_images()
-        self.set_image(self.images[self.ICON])
+        # The images from the registry are already the right size, so they are not resized for each item:
+        self.set_resized_image(self.images[self.ICON])
 
         # How much the image should be offset by to match the hand of the player:
         # Values for this is set by the player, since if the player model was to change,
@@ -70,10 +103,26 @@ class Item(Tile):  # [TESTED & FINALISED]
     def get_owner(self):
         return self.owner
 
+    def get_state(self):
+        # Adding the owner and use of the item:
+        state = super().get_state()
+        state.update({"owner": self.owner, "in_use": self.in_use, "use_start_time": self.use_start_time,
+                      "image_offsets": self.image_offsets})
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        # The level is restored separately, so the owner is set without adding the item to or removing it from it:
+        self.owner = state["owner"]
+        self.in_use = state["in_use"]
+        self.use_start_time = state["use_start_time"]
+        self.image_offsets = state["image_offsets"]
+
     def import_images(self):
         # Base item class only has one image in its dictionary - children have more:
-        final_path = path.format(self.image_path, self.ICON)
-        self.images = {self.ICON: resize_image(pygame.image.load(final_path).convert_alpha(), self.max_size)}
+        # The dictionary is shared with other items using the same images, so it must not be modified.
+        self.images = ItemImageRegistry.get_images(self.game.get_asset_pack(), self.image_path, self.max_size,
+                                                   [self.ICON])
 
     def adjust_image(self):
         # Moving the image to the relevant side of the character and
@@ -103,16 +152,15 @@ class Item(Tile):  # [TESTED & FINALISED]
     def use(self):
         if not self.in_use:
             # Playing use sound:
-            self.use_sound.set_volume(self.game.get_audio_volume())
-            self.use_sound.play()
+            self.game.play_sound(self.use_sound)
             self.in_use = True
-            self.use_start_time = pygame.time.get_ticks()
+            self.use_start_time = self.game.get_simulation_time()
 
     def is_in_use(self):
         return self.in_use
 
     def update_cooldown(self):
-        current_time = pygame.time.get_ticks()
+        current_time = self.game.get_simulation_time()
 
         if current_time - self.use_start_time >= self.use_duration:
             self.in_use = False
@@ -130,9 +178,10 @@ class Item(Tile):  # [TESTED & FINALISED]
         super().draw(draw_offset)
 
     def update(self):
-        # Drawing the item if it is in use:
-        if self.in_use:
-            self.draw(self.level.get_draw_offset())
+        # Moving the item to the hand of the owner whilst it is in use, where it can hit things:
+        # It is drawn separately, after the level has been simulated.
+        if self.in_use and self.owner is not None:
+            self.adjust_image()
         self.update_cooldown()
 
 
@@ -156,6 +205,15 @@ class Potion(Item):  # [TESTED & FINALISED]
         # so that it is destroyed after the use is finished:
         self.consumed = True
 
+    def get_state(self):
+        state = super().get_state()
+        state["consumed"] = self.consumed
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.consumed = state["consumed"]
+
     def properties(self):
         inventory = self.owner.get_inventory()
         stats = self.owner.get_stats()
@@ -212,12 +270,9 @@ class Weapon(Item):  # [TESTED & FINALISED]
         self.adjust_collider()
 
     def import_images(self):
-        self.images = {self.UP: [], self.DOWN: [], self.LEFT: [], self.RIGHT: [], self.ICON: []}
-
-        # Filling the image dictionary with images for each direction and the icon:
-        for file_name in self.images.keys():
-            final_path = self.image_path + "/" + file_name
-            self.images[file_name] = resize_image(pygame.image.load(final_path).convert_alpha(), self.max_size)
+        # The image dictionary has images for each direction and the icon:
+        self.images = ItemImageRegistry.get_images(self.game.get_asset_pack(), self.image_path, self.max_size,
+                                                   [self.UP, self.DOWN, self.LEFT, self.RIGHT, self.ICON])
 
     def get_icon(self):
         return self.images[self.ICON]
@@ -239,13 +294,11 @@ class Weapon(Item):  # [TESTED & FINALISED]
         # Can only deal damage if owned by a character:
         if self.owner is None: return
 
-        # Obtaining vulnerable tiles in frame from the level:
-        vulnerable_tiles = self.game.get_current_level().get_vulnerable_tiles_in_frame().copy()
-
-        # Weapon should not damage the owner:
-        if self.owner in vulnerable_tiles: vulnerable_tiles.remove(self.owner)
+        # Only the vulnerable tiles near the weapon can be hit:
+        for tile in self.game.get_current_level().get_vulnerable_tiles_near(self.collider):
+            # Weapon should not damage the owner:
+            if tile is self.owner: continue
 
-        for tile in vulnerable_tiles:
             if self.collider.colliderect(tile.get_collider()):
                 output_damage = self.damage * self.game.get_current_frame_time() * self.owner.get_stats()[Character.DAMAGE_MULTIPLIER]
 
@@ -1,9 +1,14 @@
 import pygame.display
-from pytmx import *
+import numpy as np
+from itertools import islice
 from items import *
 from tile import *
 from utils import *
 from colours import *
+from spatial_grid import SpatialGrid
+from trigger_grid import TriggerGrid
+from static_tile_store import StaticTileStore
+from compiled_map import CompiledMap, CompiledTileLayer, CompiledObjectLayer
 
 
 class Level:  # [TESTED & FINALISED]
@@ -23,7 +28,31 @@ class Level:  # [TESTED & FINALISED]
     # The resolution of the tile images:
     TILE_RESOLUTION = 256
 
-    def __init__(self, game, level_id):
+    # The length of each cell of the spatial grids in tiles:
+    GRID_CELL_SIZE = 4
+
+    # The length of each pre-baked chunk of flat tiles in pixels:
+    # This does not depend on the resolution, so that higher resolutions use more, rather than larger, chunks,
+    # and chunks only cover the areas near flat tiles rather than large areas of background.
+    CHUNK_SIZE = 512
+
+    # The most memory that the pre-baked chunks can take up in bytes:
+    # Each chunk takes up CHUNK_SIZE * CHUNK_SIZE * 4 bytes (1MB), and is only created if a flat tile overlaps it.
+    # Once the limit is reached, the remaining flat tiles are drawn individually instead, which is slower but correct.
+    MAX_CHUNK_BYTES = 96 * 1024 * 1024
+
+    # The length of the longest side of the minimap as a proportion of the screen size:
+    MINIMAP_SIZE = 0.2
+
+    # How close the player needs to be to the quest board in tiles for the next level to start loading:
+    PRELOAD_DISTANCE = 15
+
+    # Whether buildings collide using the opaque pixels of their images instead of the shapes in the Colliders layer:
+    # Maps made for this do not need Collider objects around each building.
+    BUILDING_MASK_COLLIDERS = False
+
+    # The map can be provided if it has already been loaded, such as by the level preloader:
+    def __init__(self, game, level_id, map_data=None):
         # Attributes for game and database:
         self.game = game
         self.database_helper = game.get_database_helper()
@@ -51,19 +80,23 @@ class Level:  # [TESTED & FINALISED]
         # Setting the scale factor for the correct conversion of the position of objects:
         self.scale_factor = self.TILE_RESOLUTION / self.tile_size
 
-        # The 4 line segments (represented as groups of 2 points) that make up the display:
-        # Used for drawing indicators where lines connecting items of interest and the screen lines intersect:
-        self.display_lines = []
-
         # Importing map data:
         self.map_set_up = False
         self.id = level_id
-        # Obtaining a list of item/object positions and surfaces by layer using pytmx:
-        self.tmx_data = load_pygame(Utils().get_level_path(self.id))
+        # Obtaining the item/object positions and images by layer, from the compiled map cache if it is up to date:
+        self.map_path = Utils().get_level_path(self.id)
+        self.map_data = map_data if map_data is not None else CompiledMap(self.map_path)
 
         # Background colour of the map:
         self.background_colour = Utils().get_level_colour(self.id)
 
+        # The size of the map in pixels:
+        self.map_size = (self.map_data.width * self.tile_size, self.map_data.height * self.tile_size)
+
+        # A scaled down image of everything on the map that does not move, created when the map is set up.
+        # Only the markers for moving things need to be drawn on top of it each frame:
+        self.minimap_image = None
+
         # Draw offset amount for the simulated camera:
         self.draw_offset = pygame.math.Vector2()
 
@@ -82,18 +115,66 @@ class Level:  # [TESTED & FINALISED]
         self.tile_lists = [self.flat_tiles, self.depth_tiles, self.dynamic_tiles, self.obstacle_tiles,
                            self.item_tiles, self.hostile_tiles, self.vulnerable_tiles]
 
+        # The geometry of the tiles that never move, which make up most of the map, is kept in arrays.
+        # The static tiles on-screen are found and positioned with a few array operations each frame,
+        # and static depth tiles are kept in order of y-position so that only moving tiles need to be put in order:
+        self.static_tiles = StaticTileStore(self.get_depth)
+
+        # Spatial grids for the moving tiles in the groups that need to be checked against the screen each frame.
+        # These allow the tiles in frame to be found by only looking at the cells the screen overlaps,
+        # so the cost depends on what is on-screen rather than the size of the map:
+        cell_size = self.GRID_CELL_SIZE * self.tile_size
+        self.flat_grid = SpatialGrid(cell_size)
+        self.moving_depth_grid = SpatialGrid(cell_size)
+        self.dynamic_grid = SpatialGrid(cell_size)
+        self.obstacle_grid = SpatialGrid(cell_size)
+        self.vulnerable_grid = SpatialGrid(cell_size)
+
+        # A spatial grid of the obstacles that never move, indexed by their colliders,
+        # so that characters only need to check for collision with the few obstacles near them:
+        # It is not in the list of grids below, since these obstacles are never moved or removed whilst playing.
+        self.static_collider_grid = SpatialGrid(cell_size, rect_function=lambda tile: tile.get_collider())
+
+        # A list of all spatial grids:
+        self.tile_grids = [self.flat_grid, self.moving_depth_grid, self.dynamic_grid,
+                           self.obstacle_grid, self.vulnerable_grid]
+
+        # Areas that the player triggers by walking into them, which are the items on the ground,
+        # and the area around the quest board from which it can be seen:
+        self.trigger_grid = TriggerGrid(cell_size)
+        # Whether the player is close enough to the quest board for it to be on-screen:
+        self.quest_board_in_range = False
+
         # Groups for tiles in frame (re-calculated each frame):
-        self.flat_tiles_in_frame = []  # Flat sprites that are on-screen.
-        self.depth_tiles_in_frame = []  # Depth sprites that are on-screen.
         self.dynamic_tiles_in_frame = []  # Dynamic sprites that are on-screen
-        self.obstacle_tiles_in_frame = []  # Obstacle sprites that are on-screen.
-        self.item_tiles_in_frame = []  # Item sprites that are on-screen.
-        self.vulnerable_tiles_in_frame = []  # Vulnerable sprites that are on-screen.
+
+        # The indices of the static flat and depth tiles on-screen within the static tile store:
+        self.static_flat_indices_in_frame = np.zeros(0, dtype=np.int64)
+        self.static_depth_indices_in_frame = np.zeros(0, dtype=np.int64)
+        # The moving flat and depth tiles on-screen, and the positions at which
+        # each moving depth tile is drawn among the static depth tiles:
+        self.moving_flat_tiles_in_frame = []
+        self.moving_depth_tiles_in_frame = []
+        self.moving_depth_positions_in_frame = []
+
+        # Surfaces that flat tiles are composited into when the map is set up, by (column, row) of the chunk.
+        # Since flat tiles never move, only the few chunks on-screen need to be drawn instead of every flat tile:
+        self.chunk_pixel_size = self.CHUNK_SIZE
+        self.flat_chunks = {}
+
+        # The (surface, position) commands used to draw the map with a single call each frame:
+        # The list is kept between frames and only grows when more commands are needed than ever before.
+        self.render_commands = []
+        # The number of commands written in the last frame:
+        self.render_command_count = 0
+
+        # The state of the level once the map has been set up, which it is put back to when it is restarted:
+        self.snapshot = None
 
     def get_id(self):
         return self.id
 
-    def set_up_map(self):
+    def set_up_map(self, bake_flat_tiles=True):
         if self.map_set_up: return
         self.map_set_up = True
 
@@ -105,8 +186,10 @@ class Level:  # [TESTED & FINALISED]
         self.set_up_layer(self.TREES, collider_ratio=(0.6, 0.4), visible=True, depth=True, obstacle=True)
         self.set_up_layer(self.ROCKS, collider_ratio=(0.7, 0.7), visible=True, depth=True, obstacle=True)
 
-        # Because buildings can have different shapes, they have custom colliders, they themselves are not obstacles:
-        self.set_up_layer(self.BUILDINGS, visible=True, depth=True, obstacle=False)
+        # Because buildings can have different shapes, they have custom colliders, they themselves are not obstacles,
+        # unless they collide using the masks of their images:
+        self.set_up_layer(self.BUILDINGS, visible=True, depth=True, obstacle=self.BUILDING_MASK_COLLIDERS,
+                          mask_collider=self.BUILDING_MASK_COLLIDERS)
         self.set_up_layer(self.QUEST_BOARD, visible=True, depth=True, obstacle=False)
 
         # Item layers have the same name as the items themselves.
@@ -128,57 +211,155 @@ class Level:  # [TESTED & FINALISED]
         self.set_up_layer(self.BARRIERS, collider_ratio=(1, 1), visible=False, obstacle=True)
         self.set_up_layer(self.COLLIDERS, collider_ratio=(1, 1), visible=False, obstacle=True)
 
+        # Compositing the flat tiles into chunks if enabled:
+        if bake_flat_tiles: self.bake_flat_tiles()
+
+        self.create_minimap_image()
+
+        # Recording the state of the level before it is played, so that it can be restarted without setting it up again:
+        self.take_snapshot()
+
+        # Saving any images that were resized for the first time, along with the files the map images came from,
+        # so that they do not need to be resized again next time:
+        asset_pack = self.game.get_asset_pack()
+        asset_pack.add_sources(self.get_source_paths())
+        asset_pack.save()
+
+    def get_source_paths(self):
+        # The paths of the map file, its tilesets and the image of each tile in the map:
+        return self.map_data.get_source_paths()
+
+    def take_snapshot(self):
+        # Tiles that do not move never change, so only the moving tiles and the items of the characters are recorded,
+        # along with the groups and spatial grids, which change as enemies die and items are dropped or picked up:
+        tiles = list(self.dynamic_tiles)
+        for tile in self.dynamic_tiles:
+            if isinstance(tile, Character): tiles += list(tile.get_inventory())
+
+        self.snapshot = {"states": [(tile, tile.get_state()) for tile in tiles],
+                         "groups": [list(tile_list) for tile_list in self.tile_lists],
+                         "grids": [tile_grid.get_tiles() for tile_grid in self.tile_grids]}
+
+    def restore_snapshot(self):
+        # Putting the level back to how it was when the map was set up.
+        # Returns whether this was possible, which it is not if the map has not been set up:
+        if self.snapshot is None: return False
+
+        for tile, state in self.snapshot["states"]: tile.set_state(state)
+
+        # The grids are rebuilt after the tiles have been moved back, keeping the order the tiles were inserted in:
+        for tile_list, tiles in zip(self.tile_lists, self.snapshot["groups"]): tile_list[:] = tiles
+        for tile_grid, tiles in zip(self.tile_grids, self.snapshot["grids"]):
+            tile_grid.clear()
+            for tile in tiles: tile_grid.insert(tile)
+
+        # The triggers are put back for the items on the ground and the quest board, which the player has not entered:
+        self.trigger_grid.clear()
+        for item in self.item_tiles: self.add_item_trigger(item)
+        if self.quest_board is not None: self.add_quest_board_trigger()
+        self.quest_board_in_range = False
+
+        self.done = False
+        return True
+
     def add_tile(self, tile, visible=True, depth=True, obstacle=True, dynamic=False, item=False, hostile=False,
                  vulnerable=False):
-        # Adding tile into relevant groups:
+        # Adding tile into relevant groups, and either the static tile store or the spatial grids:
+        static_flags = 0
         if visible:
-            if depth: self.depth_tiles.append(tile)
-            else: self.flat_tiles.append(tile)
-        if obstacle: self.obstacle_tiles.append(tile)
-        if dynamic: self.dynamic_tiles.append(tile)
-        if item: self.item_tiles.append(tile)
+            if depth:
+                self.depth_tiles.append(tile)
+                if dynamic: self.moving_depth_grid.insert(tile)
+                else: static_flags |= StaticTileStore.DEPTH
+            else:
+                self.flat_tiles.append(tile)
+                if dynamic: self.flat_grid.insert(tile)
+                else: static_flags |= StaticTileStore.FLAT
+        if obstacle:
+            self.obstacle_tiles.append(tile)
+            if dynamic: self.obstacle_grid.insert(tile)
+            else: self.static_collider_grid.insert(tile)
+        if static_flags: self.static_tiles.add(tile, static_flags)
+        if dynamic:
+            self.dynamic_tiles.append(tile)
+            self.dynamic_grid.insert(tile)
+        if item:
+            self.item_tiles.append(tile)
+            self.add_item_trigger(tile)
         if hostile: self.hostile_tiles.append(tile)
-        if vulnerable: self.vulnerable_tiles.append(tile)
+        if vulnerable:
+            self.vulnerable_tiles.append(tile)
+            self.vulnerable_grid.insert(tile)
 
     def remove_tile(self, tile):
         # Removing tile from all groups:
         for tile_list in self.tile_lists:
             if tile in tile_list: tile_list.remove(tile)
+        for tile_grid in self.tile_grids: tile_grid.remove(tile)
+        self.static_collider_grid.remove(tile)
+        self.trigger_grid.remove(tile)
+        self.static_tiles.remove(tile)
         # No need to remove from in_frame groups, since these are re-calculated each frame.
 
+    def add_item_trigger(self, item):
+        # Items on the ground are picked up as soon as the player walks into them:
+        self.trigger_grid.add(item, item.get_collider, on_enter=lambda player: player.pick_up_item(item))
+
+    def add_quest_board_trigger(self):
+        # The quest board is on-screen whenever the player is within half the size of the screen of it,
+        # since the screen is centred on the player:
+        self.trigger_grid.add(self.quest_board, lambda: self.quest_board.get_rect().inflate(self.display_rect.size),
+                              on_enter=lambda player: self.set_quest_board_in_range(True),
+                              on_exit=lambda player: self.set_quest_board_in_range(False))
+
+    def set_quest_board_in_range(self, value):
+        self.quest_board_in_range = value
+
+    def update_triggers(self, tile):
+        # Calling the functions of the triggers that the tile has entered or left since it last moved:
+        self.trigger_grid.update(tile, tile.get_collider())
+
+    def move_tile(self, tile):
+        # Must be called when the rectangle of a tile changes, so that the spatial grids stay correct:
+        for tile_grid in self.tile_grids: tile_grid.move(tile)
+        self.trigger_grid.move(tile)
+        self.static_tiles.move(tile)
+
     def set_up_layer(self, layer_name, collider_ratio=(0.9, 0.9), visible=True, depth=True, obstacle=True,
-                     dynamic=False, item=False, hostile=False, vulnerable=False):
+                     dynamic=False, item=False, hostile=False, vulnerable=False, mask_collider=False):
         # If a rotated or flipped map_object/tile is used,
         # pytmx is supposed to adjust the image automatically and return the correct surface.
         # However, this does not work for me, and I cannot figure out why.
         # For this reason, not using rotated or flipped objects/tiles,
         # creating a duplicate flipped/rotated image if absolutely necessary.
 
-        # Validating layer name:
+        # Returns a CompiledTileLayer or CompiledObjectLayer instance.
+        # CompiledTileLayer.iter_data() returns the position and gid of each tile in the layer.
+        # CompiledObjectLayer returns the position, size and gid of each map object in the layer.
         # Not creating the layer if it has been set as invisible in Tiled - useful for debugging:
-        if layer_name not in [layer.name for layer in self.tmx_data.visible_layers]: return
-
-        # Returns a TiledTileLayer or TiledObjectGroup instance.
-        # TiledTileLayer.tiles() returns the position and surface of each tile in the layer.
-        # TiledObjectGroup returns the position, size and surface of each map_object in the layer.
-        layer = self.tmx_data.get_layer_by_name(layer_name)
+        layer = self.map_data.get_layer(layer_name)
+        if layer is None: return
 
         # If map_object layer:
-        if isinstance(layer, TiledObjectGroup):
-            for map_object in layer:
-                if map_object.image is not None:
+        if isinstance(layer, CompiledObjectLayer):
+            for x, y, width, height, gid in layer:
+                # The image is only loaded if its scaled version has not been kept from before:
+                image_loader = self.map_data.get_tile_image_loader(gid)
+                if image_loader is not None:
                     tile = Tile(self.game,
-                                position=(map_object.x / self.scale_factor, map_object.y / self.scale_factor),
-                                size=(map_object.width / self.TILE_RESOLUTION,
-                                      map_object.height / self.TILE_RESOLUTION),
+                                position=(x / self.scale_factor, y / self.scale_factor),
+                                size=(width / self.TILE_RESOLUTION, height / self.TILE_RESOLUTION),
                                 # The aspect ratio of objects should not be protected:
-                                collider_ratio=collider_ratio, image=map_object.image,
+                                collider_ratio=collider_ratio, image=image_loader,
                                 # Objects images can be stretched for more variety:
-                                protect_aspect_ratio=False)
+                                protect_aspect_ratio=False,
+                                # Objects with the same image and size can share the scaled image and its mask:
+                                image_id=(self.map_path, gid), mask_collider=mask_collider)
 
                     # Checking for special objects:
                     if layer_name == self.QUEST_BOARD:
                         self.quest_board = tile
+                        self.add_quest_board_trigger()
                         self.set_up_quest_board_views()
 
                     # Adding map object to correct groups:
@@ -186,9 +367,12 @@ class Level:  # [TESTED & FINALISED]
                                   hostile=hostile, vulnerable=vulnerable)
 
         # If tile layer:
-        elif isinstance(layer, TiledTileLayer):
-            for x, y, surface in layer.tiles():
-                if surface is not None:
+        elif isinstance(layer, CompiledTileLayer):
+            # Iterating over the gid of each tile, which identifies its image within the map:
+            for x, y, gid in layer.iter_data():
+                # The image is only loaded if its scaled version has not been kept from before:
+                image_loader = self.map_data.get_tile_image_loader(gid)
+                if image_loader is not None:
                     # Converting the position of the tile to pixels:
                     tile_position = (x * self.tile_size, y * self.tile_size)
 
@@ -210,63 +394,210 @@ class Level:  # [TESTED & FINALISED]
                             tile.set_top_left(tile_position)
                         else:
                             # Other tiles:
-                            tile = Tile(self.game, position=tile_position, collider_ratio=collider_ratio, image=surface,
+                            tile = Tile(self.game, position=tile_position, collider_ratio=collider_ratio,
+                                        image=image_loader,
                                         # The aspect ratio of tiles should be protected:
-                                        protect_aspect_ratio=True)
+                                        protect_aspect_ratio=True,
+                                        # Tiles with the same image can share the scaled image and its mask:
+                                        image_id=(self.map_path, gid), mask_collider=mask_collider)
 
                         # Adding tile to correct groups:
                         self.add_tile(tile, visible=visible, depth=depth, obstacle=obstacle, dynamic=dynamic, item=item,
                                       hostile=hostile, vulnerable=vulnerable)
 
-    def calculate_group_tiles_in_frame(self, group):
-        tiles_in_frame = []
-
-        for sprite in group:
-            # Checking collision with screen rectangle and rectangle of the sprite's image:
-            if pygame.Rect.colliderect(sprite.rect, self.display_rect):
-                tiles_in_frame.append(sprite)
-
-        return tiles_in_frame
+    def bake_flat_tiles(self):
+        # The memory taken up by each chunk, which are 32-bit surfaces:
+        chunk_bytes = self.chunk_pixel_size * self.chunk_pixel_size * 4
+
+        for tile in self.flat_tiles:
+            # Only tiles that never move can be baked:
+            static_flags = self.static_tiles.get_flags(tile)
+            if not static_flags & StaticTileStore.FLAT: continue
+
+            tile_rect = tile.get_rect()
+
+            # A tile may overlap the edges of multiple chunks, in which case it is drawn onto each of them:
+            left, top = tile_rect.left // self.chunk_pixel_size, tile_rect.top // self.chunk_pixel_size
+            right = (tile_rect.right - 1) // self.chunk_pixel_size
+            bottom = (tile_rect.bottom - 1) // self.chunk_pixel_size
+            cells = [(column, row) for column in range(left, right + 1) for row in range(top, bottom + 1)]
+
+            # Stopping once the chunks the tile needs would take up too much memory.
+            # The remaining tiles are drawn individually on top of the chunks, so they are still drawn in order:
+            new_chunk_count = sum(1 for cell in cells if cell not in self.flat_chunks)
+            if (len(self.flat_chunks) + new_chunk_count) * chunk_bytes > self.MAX_CHUNK_BYTES: break
+
+            for cell in cells:
+                chunk = self.flat_chunks.get(cell)
+                if chunk is None:
+                    # Chunks are filled with the background colour so that they can be opaque,
+                    # which is faster to draw and looks identical to drawing the tiles on the background:
+                    chunk = pygame.Surface((self.chunk_pixel_size, self.chunk_pixel_size)).convert()
+                    chunk.fill(self.background_colour)
+                    self.flat_chunks[cell] = chunk
+
+                # Flat tiles are drawn in the order they were added, so overlapping tiles look the same:
+                chunk.blit(tile.image, (tile_rect.left - cell[0] * self.chunk_pixel_size,
+                                        tile_rect.top - cell[1] * self.chunk_pixel_size))
+
+            # The tile no longer needs to be drawn individually:
+            self.static_tiles.set_flags(tile, static_flags & ~StaticTileStore.FLAT)
+
+    def create_minimap_image(self):
+        # The scale is chosen so that the longest side of the map fits the minimap:
+        scale = self.game.unit_to_pixel(self.MINIMAP_SIZE) / max(self.map_size)
+        self.minimap_image = pygame.Surface([max(1, round(dimension * scale)) for dimension in self.map_size]).convert()
+        self.minimap_image.fill(self.background_colour)
+
+        # The same image is used by many tiles, so each image only needs to be scaled down once for each size:
+        scaled_images = {}
+
+        def draw_scaled(image, rect):
+            position = (round(rect.left * scale), round(rect.top * scale))
+            size = (max(1, round(rect.width * scale)), max(1, round(rect.height * scale)))
+            key = (image, size)
+            if key not in scaled_images: scaled_images[key] = pygame.transform.smoothscale(image, size)
+            self.minimap_image.blit(scaled_images[key], position)
+
+        # Drawing the baked chunks, which contain most of the flat tiles:
+        for (column, row), chunk in self.flat_chunks.items():
+            draw_scaled(chunk, pygame.Rect(column * self.chunk_pixel_size, row * self.chunk_pixel_size,
+                                           self.chunk_pixel_size, self.chunk_pixel_size))
+
+        # Drawing flat tiles that have not been baked, followed by depth tiles that do not move in order of y-position:
+        map_rect = pygame.Rect((0, 0), self.map_size)
+        for flag in (StaticTileStore.FLAT, StaticTileStore.DEPTH):
+            for tile in self.static_tiles.get_tiles(self.static_tiles.query_indices(map_rect, flag)):
+                draw_scaled(tile.image, tile.get_rect())
+
+    def get_minimap_image(self):
+        return self.minimap_image
+
+    def get_map_size(self):
+        return self.map_size
+
+    def get_minimap_markers(self):
+        # The positions and colours of the markers for the things on the map that move or need to stand out:
+        markers = [(hostile.get_collider().center, RED) for hostile in self.hostile_tiles]
+        if self.quest_board is not None: markers.append((self.quest_board.get_collider().center, GREEN))
+        markers.append((self.player.get_collider().center, BLUE))
+        return markers
+
+    def get_flat_chunks_in_frame(self):
+        # Returns the chunks that the screen overlaps, with the map position of their top left corners:
+        chunks_in_frame = []
+
+        # The range of chunks that the screen overlaps:
+        left = self.display_rect.left // self.chunk_pixel_size
+        top = self.display_rect.top // self.chunk_pixel_size
+        right = (self.display_rect.right - 1) // self.chunk_pixel_size
+        bottom = (self.display_rect.bottom - 1) // self.chunk_pixel_size
+
+        for column in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                chunk = self.flat_chunks.get((column, row))
+                if chunk is not None:
+                    chunks_in_frame.append((chunk, column * self.chunk_pixel_size, row * self.chunk_pixel_size))
+
+        return chunks_in_frame
+
+    def calculate_group_tiles_in_frame(self, grid):
+        # Querying the spatial grid of the group with the screen rectangle,
+        # which only checks the tiles in the cells that the screen overlaps:
+        return grid.query(self.display_rect)
+
+    @staticmethod
+    def get_depth(tile):
+        # Sprites with depth effect are drawn in ascending order of y-position:
+        return tile.rect.centery
+
+    def calculate_depth_tiles_in_frame(self):
+        # The static depth tiles on-screen are already in order of y-position,
+        # so only the few moving depth tiles on-screen are sorted, in ascending order of y-position:
+        self.moving_depth_tiles_in_frame = self.calculate_group_tiles_in_frame(self.moving_depth_grid)
+        self.moving_depth_tiles_in_frame.sort(key=self.get_depth)
+
+        # Each moving tile goes after the static tiles with the same or lower y-position:
+        self.moving_depth_positions_in_frame = np.searchsorted(
+            self.static_tiles.get_depths(self.static_depth_indices_in_frame),
+            [self.get_depth(tile) for tile in self.moving_depth_tiles_in_frame], side="right").tolist()
 
     def calculate_all_tiles_in_frame(self):
-        # Checking which sprites are on-screen, as we only need to be concerned with those:
-        self.flat_tiles_in_frame = self.calculate_group_tiles_in_frame(self.flat_tiles)
-        self.depth_tiles_in_frame = self.calculate_group_tiles_in_frame(self.depth_tiles)
+        # Checking which sprites are on-screen, as we only need to be concerned with those.
+        # The static tiles on-screen are found first, all at once:
+        self.static_flat_indices_in_frame = self.static_tiles.query_indices(self.display_rect, StaticTileStore.FLAT)
+        self.static_depth_indices_in_frame = self.static_tiles.query_indices(self.display_rect, StaticTileStore.DEPTH)
 
-        # The following is used to only update tiles if they are on-screen:
-        self.dynamic_tiles_in_frame = self.calculate_group_tiles_in_frame(self.dynamic_tiles)
+        self.moving_flat_tiles_in_frame = self.calculate_group_tiles_in_frame(self.flat_grid)
+        # Depth tiles are drawn in ascending order of y-position, with the moving ones among the static ones:
+        self.calculate_depth_tiles_in_frame()
 
-        # The following are used for collision by the player & enemies:
-        self.obstacle_tiles_in_frame = self.calculate_group_tiles_in_frame(self.obstacle_tiles)
-        self.item_tiles_in_frame = self.calculate_group_tiles_in_frame(self.item_tiles)
-        # For collision with weapons:
-        self.vulnerable_tiles_in_frame = self.calculate_group_tiles_in_frame(self.vulnerable_tiles)
+        # The following is used to only update tiles if they are on-screen:
+        self.dynamic_tiles_in_frame = self.calculate_group_tiles_in_frame(self.dynamic_grid)
 
     def draw_map(self):
         # Calculating how far the player is from the centre of the screen,
         # and determining correct offset such that the player is back at the centre:
         self.draw_offset.x = self.display.get_rect().centerx - self.player.get_rect().centerx
         self.draw_offset.y = self.display.get_rect().centery - self.player.get_rect().centery
-
-        # First drawing sprites without depth effect since these are at the background:
-        for tile in self.flat_tiles_in_frame:
-            tile.draw(self.draw_offset)
-
-        # Sorting sprites with depth effect in ascending order of y-position:
-        for tile in sorted(self.depth_tiles_in_frame, key=lambda sprite_in_list: sprite_in_list.rect.centery):
-            tile.draw(self.draw_offset)
+        offset_x, offset_y = int(self.draw_offset.x), int(self.draw_offset.y)
+
+        chunks_in_frame = self.get_flat_chunks_in_frame()
+
+        # Everything is drawn with a single call using the render commands, which are written in place:
+        command_count = (len(chunks_in_frame) + len(self.static_flat_indices_in_frame) +
+                         len(self.moving_flat_tiles_in_frame) + len(self.static_depth_indices_in_frame) +
+                         len(self.moving_depth_tiles_in_frame))
+        if len(self.render_commands) < command_count:
+            self.render_commands.extend([None] * (command_count - len(self.render_commands)))
+        commands = self.render_commands
+        index = 0
+
+        # First drawing sprites without depth effect since these are at the background.
+        # Baked flat tiles are drawn as chunks, and any others are drawn individually:
+        for chunk, x, y in chunks_in_frame:
+            commands[index] = (chunk, (x + offset_x, y + offset_y))
+            index += 1
+        # The screen positions of all static tiles on-screen are calculated at once:
+        index = self.static_tiles.write_draw_commands(commands, index, self.static_flat_indices_in_frame,
+                                                      (offset_x, offset_y))
+        for tile in self.moving_flat_tiles_in_frame:
+            commands[index] = (tile.image, (tile.rect.x + offset_x, tile.rect.y + offset_y))
+            index += 1
+
+        # Sprites with depth effect are drawn in ascending order of y-position.
+        # Each moving tile is written after the static tiles that come before it:
+        start = 0
+        for position, tile in zip(self.moving_depth_positions_in_frame, self.moving_depth_tiles_in_frame):
+            index = self.static_tiles.write_draw_commands(commands, index,
+                                                          self.static_depth_indices_in_frame[start:position],
+                                                          (offset_x, offset_y))
+            commands[index] = (tile.image, (tile.rect.x + offset_x, tile.rect.y + offset_y))
+            index += 1
+            start = position
+        index = self.static_tiles.write_draw_commands(commands, index, self.static_depth_indices_in_frame[start:],
+                                                      (offset_x, offset_y))
+
+        # Clearing the commands left over from earlier frames, so that they do not keep old images in memory:
+        if self.render_command_count > index:
+            commands[index:self.render_command_count] = [None] * (self.render_command_count - index)
+        self.render_command_count = index
+
+        # Only the commands written this frame are drawn:
+        self.display.blits(islice(commands, index), doreturn=False)
 
     def get_player(self):
         return self.player
 
-    def get_obstacle_tiles_in_frame(self):
-        return self.obstacle_tiles_in_frame
-
-    def get_item_tiles_in_frame(self):
-        return self.item_tiles_in_frame
+    def get_obstacle_tiles_near(self, rect):
+        # Returns the obstacles that may collide with the rectangle, the obstacles that never move first,
+        # followed by the moving obstacles, each in the order they were added to the level.
+        # Moving obstacles are indexed by their rectangles, which contain their colliders:
+        return self.static_collider_grid.query(rect) + self.obstacle_grid.query(rect)
 
-    def get_vulnerable_tiles_in_frame(self):
-        return self.vulnerable_tiles_in_frame
+    def get_vulnerable_tiles_near(self, rect):
+        # Returns the vulnerable tiles that may collide with the rectangle, used for collision with weapons:
+        return self.vulnerable_grid.query(rect)
 
     def get_tile_size(self):
         return self.tile_size
@@ -282,51 +613,40 @@ class Level:  # [TESTED & FINALISED]
         # Saving the player's progress:
         self.database_helper.update_player(self.player)
 
-    def calculate_display_lines(self):
-        # Centering the display rectangle:
+    def calculate_display_rect(self):
+        # Centering the display rectangle on the player:
+        # Used for drawing indicators where lines connecting items of interest and the screen edges intersect:
         self.display_rect.center = self.player.get_rect().center
-        # The 4 line segments (represented as groups of 2 points) that make up the display:
-        # Used for drawing indicators where lines connecting items of interest and the screen lines intersect:
-        top = (self.display_rect.topleft, self.display_rect.topright)
-        right = (self.display_rect.topright, self.display_rect.bottomright)
-        bottom = (self.display_rect.bottomright, self.display_rect.bottomleft)
-        left = (self.display_rect.bottomleft, self.display_rect.topleft)
-        self.display_lines = [top, right, bottom, left]
 
     def draw_hostile_indicators(self):
-        for hostile in self.hostile_tiles:
-            hostile_center = hostile.get_collider().center
-            # Obtaining the centres of the player and hostile character, which represents the line segment between them:
-            player_to_hostile = (self.player.get_collider().center, hostile_center)
-
-            # The minimum distance between the hostile and player for the indicator to show up:
-            # This takes into account the player's stealth value - higher the stealth,
-            # the greater the distance from which the indicator can be seen:
-            min_distance = \
-                Utils.INDICATOR_DISTANCE * self.tile_size * self.player.get_stats()[Player.STEALTH_MULTIPLIER]
-
-            if self.player.get_distance_to(hostile_center) < min_distance:
-                # Iterating over each display line segment (the 4 lines that make up the display):
-                for line in self.display_lines:
-                    # Determining if and where the display line segment and the
-                    # line segment connecting the player and hostile intersects:
-                    intersection = get_segment_intersection(player_to_hostile, line)
-                    if intersection is not None:
-                        # If there is an intersection, drawing a red indicator:
-                        self.draw_indicator(intersection + self.draw_offset, RED)
+        if len(self.hostile_tiles) == 0: return
+
+        player_center = self.player.get_collider().center
+        hostile_centers = np.array([hostile.get_collider().center for hostile in self.hostile_tiles], dtype=float)
+
+        # The minimum distance between the hostile and player for the indicator to show up:
+        # This takes into account the player's stealth value - higher the stealth,
+        # the greater the distance from which the indicator can be seen:
+        min_distance = \
+            Utils.INDICATOR_DISTANCE * self.tile_size * self.player.get_stats()[Player.STEALTH_MULTIPLIER]
+
+        # Only hostiles close enough to the player are considered, all at once:
+        distances = np.hypot(hostile_centers[:, 0] - player_center[0], hostile_centers[:, 1] - player_center[1])
+        hostile_centers = hostile_centers[distances < min_distance]
+
+        # Determining where the line segments connecting the player and each hostile leave the screen,
+        # and drawing a red indicator at each of these points:
+        self.draw_indicators(get_rect_exit_points(player_center, hostile_centers, self.display_rect), RED)
 
     def draw_quest_board_indicator(self):
-        # Obtaining the centres of the player and quest board, which represents the line segment between them:
-        player_to_board = (self.player.get_collider().center, self.quest_board.get_collider().center)
-
-        # Iterating over each display line segment (the 4 lines that make up the display):
-        for line in self.display_lines:
-            # Determining if and where the display line segment and the
-            # line segment connecting the player and quest board intersects:
-            intersection = get_segment_intersection(player_to_board, line)
-            if intersection is not None:
-                # If there is an intersection, drawing a green indicator:
-                self.draw_indicator(intersection + self.draw_offset, GREEN)
+        # Determining where the line segment connecting the player and the quest board leaves the screen, if it does,
+        # and drawing a green indicator at that point:
+        self.draw_indicators(get_rect_exit_points(self.player.get_collider().center,
+                                                  self.quest_board.get_collider().center, self.display_rect), GREEN)
+
+    def draw_indicators(self, points, colour):
+        # The points are positions on the map, so they are moved onto the screen:
+        for point in (points + (self.draw_offset.x, self.draw_offset.y)).tolist(): self.draw_indicator(point, colour)
 
     def draw_indicator(self, point, colour):
         pygame.draw.circle(self.display, colour, point, Utils.INDICATOR_RADIUS * self.tile_size)
@@ -383,16 +703,35 @@ class Level:  # [TESTED & FINALISED]
 
         for view in self.quest_board_views: view.update()
 
-    def update(self):
-        # Centering the camera on the player and calculating the points representing the
-        # 4 line segments that make up the display (used for many features):
-        self.calculate_display_lines()
+    def preload_next_level(self):
+        # The next level is likely to be played once all hostiles are dead or the player is near the quest board,
+        # so it starts loading in the background:
+        distance = self.player.get_distance_to(self.quest_board.get_collider().center)
+        if len(self.hostile_tiles) == 0 or distance < self.PRELOAD_DISTANCE * self.tile_size:
+            self.game.preload_level(self.id + 1)
+
+    def simulate(self):
+        # Simulating a single step of the level, which happens a fixed number of times per second.
+        # Centering the camera on the player (used for many features):
+        self.calculate_display_rect()
+
+        # Updating the tiles on-screen that need to be updated:
+        self.dynamic_tiles_in_frame = self.calculate_group_tiles_in_frame(self.dynamic_grid)
+        for tile in self.dynamic_tiles_in_frame: tile.update()
+
+        # Ensuring that there is a quest board in the map:
+        if self.quest_board is not None: self.preload_next_level()
+
+    def draw(self):
+        # Drawing the level as it is after the last simulation step, which happens once per frame.
+        # Centering the camera on the player (used for many features):
+        self.calculate_display_rect()
 
         # Calculating which tiles are in the frame and need to be processed further:
         self.calculate_all_tiles_in_frame()
         self.draw_map()
-        # Updating tiles that need to be updated:
-        for tile in self.dynamic_tiles_in_frame: tile.update()
+        # Drawing anything that goes on top of the tiles, such as items being used and health bars:
+        for tile in self.dynamic_tiles_in_frame: tile.draw_overlay()
 
         # Drawing indicators for enemies:
         self.draw_hostile_indicators()
@@ -400,6 +739,6 @@ class Level:  # [TESTED & FINALISED]
         if self.quest_board is not None:
             self.draw_quest_board_indicator()
             # The quest board does not need to be drawn if not on-screen:
-            if self.quest_board in self.depth_tiles_in_frame:
+            if self.quest_board_in_range:
                 # Only updating quest board information if it is in the frame:
                 self.update_quest_board_views()
@@ -0,0 +1,55 @@
+import threading
+from compiled_map import CompiledMap
+from utils import *
+
+
+# Loads the map of the level that is likely to be played next on a separate thread, whilst the current one is played:
+# Parsing a map and decoding its images is slow the first time, and would otherwise freeze the game
+# when the level changes. Only the final set-up of the level is left for when it actually starts.
+class LevelPreloader:
+
+    def __init__(self, asset_pack):
+        # Used to check whether the images of a map have already been resized and saved:
+        self.asset_pack = asset_pack
+
+        # The id of the level being loaded or that has been loaded, the thread loading it, and the loaded map:
+        self.level_id = None
+        self.thread = None
+        self.map_data = None
+
+    def load(self, map_path):
+        map_data = CompiledMap(map_path)
+
+        # The resized images are normally taken from the asset pack, in which case the tile images are not needed.
+        # Otherwise, decoding them now so that only resizing them is left for when the level is set up:
+        if not self.asset_pack.has_source(map_path):
+            for gid in map_data.get_gids():
+                if map_data.get_tile_image_loader(gid) is not None: map_data.get_tile_image(gid)
+
+        self.map_data = map_data
+
+    def start(self, level_id):
+        # Starts loading the level, unless it is already being loaded:
+        if level_id == self.level_id: return
+
+        # Waiting for any level that is already being loaded, so that two threads never write the same cache:
+        if self.thread is not None: self.thread.join()
+
+        self.level_id = level_id
+        self.map_data = None
+        self.thread = threading.Thread(target=self.load, args=(Utils().get_level_path(level_id),), daemon=True)
+        self.thread.start()
+
+    def get_map_data(self, level_id):
+        # Returns the loaded map of the level, waiting for it to finish loading if necessary,
+        # or None if a different level was being loaded:
+        if level_id != self.level_id: return None
+
+        self.thread.join()
+        map_data = self.map_data
+
+        # The map is only handed over once, so that it is not kept after the level it is given to has finished:
+        self.level_id = None
+        self.thread = None
+        self.map_data = None
+        return map_data
@@ -3,12 +3,21 @@ from pygame import mixer
 from level import *
 from strings import *
 from database_helper import DatabaseHelper
+from audio import SoundBank, MusicPlayer
+from asset_pack import AssetPack
+from level_preloader import LevelPreloader
 
 
 class Game:  # [TESTED & FINALISED]
 
     MUSIC_VOLUME_MULTIPLIER = 0.85
 
+    # How many times per second the level is simulated, independently of the frame rate:
+    SIMULATION_RATE = 60
+    # The most time in seconds that is simulated in one frame, so that the simulation does not fall further behind
+    # each frame if it cannot keep up, or after the game has been paused on another screen:
+    MAX_SIMULATION_TIME = 0.25
+
     def __init__(self):
         pygame.init()
         mixer.init()
@@ -19,8 +28,13 @@ class Game:  # [TESTED & FINALISED]
         # A helper for the relational database:
         self.database_helper = DatabaseHelper(self)
 
-        # The music that is being played at the moment:
-        self.current_music = pygame.mixer.Sound(MENU_MUSIC)
+        # Sound effects are decoded once and shared between everything that plays them:
+        self.sound_bank = SoundBank()
+
+        # Plays the music, decoding the tracks in the background so that changing tracks does not hold up a frame:
+        # The menu music is needed first, so it starts decoding straight away:
+        self.music_player = MusicPlayer()
+        self.music_player.prefetch(MENU_MUSIC)
 
         # Getting the current resolution of the physical screen:
         screen_info = pygame.display.Info()
@@ -32,6 +46,12 @@ class Game:  # [TESTED & FINALISED]
         pygame.display.set_caption(GAME_NAME)
         self.clock = pygame.time.Clock()
 
+        # Images that have already been resized for this resolution are loaded from the asset pack:
+        self.asset_pack = AssetPack(self.resolution)
+
+        # Loads the map of the next level in the background whilst the current one is played:
+        self.level_preloader = LevelPreloader(self.asset_pack)
+
         # Calculating window dimensions - this is an arbitrary unit to make everything fully resolution independent:
         if self.resolution[0] >= self.resolution[1]:
             self.window_dimensions = [self.resolution[0] / self.resolution[1], 1]
@@ -43,6 +63,19 @@ class Game:  # [TESTED & FINALISED]
         self.all_events = []
         self.key_down_events = []
 
+        # In dirty rectangle mode, the screen is not redrawn every frame.
+        # Instead, views are only drawn when they change, and only the areas that changed are updated.
+        # This is used by menus, since they are static except for when the user interacts with them:
+        self.dirty_rect_mode = False
+        # The areas of the screen that have changed this frame:
+        self.dirty_rects = []
+        # The colour of the background, used to clear views before they are drawn again:
+        self.background_colour = WHITE
+        # The views of the menu that was shown in the last frame, used to detect when the menu changes:
+        self.current_views = None
+        # How many times the whole screen has been redrawn, so views know when they need to be drawn again:
+        self.redraw_count = 0
+
         # Creating Frame Rate Counter:
         self.fps_text = TextLine(self, font_size=0.04)
 
@@ -50,11 +83,18 @@ class Game:  # [TESTED & FINALISED]
         self.frame_rate = None
         self.show_frame_rate = None
         self.audio_volume = None
+        # How much time in milliseconds has been simulated, which timers in the level are measured with,
+        # and how much time in seconds has passed that has not been simulated yet:
+        self.simulation_time = 0
+        self.unsimulated_time = 0
+
         self.current_level = None
         self.refresh_settings()
 
     def update(self):
         self.get_input()
+        # Starting any music that has finished decoding:
+        self.music_player.update()
 
         # Showing frame rate at the corner of the screen if enabled:
         if self.show_frame_rate:
@@ -62,7 +102,45 @@ class Game:  # [TESTED & FINALISED]
             # Position must be set every frame because the text can change,
             # and we need top left to be constant instead of centre:
             self.fps_text.get_rect().topleft = self.rect.topleft
-            self.fps_text.draw()
+            self.fps_text.calculate_position()
+        # Updating even if hidden, so that it can be cleared in dirty rectangle mode:
+        self.fps_text.set_visibility(self.show_frame_rate)
+        self.fps_text.update()
+
+    def start_frame(self, background_colour, views, dirty_rect_mode=True):
+        self.dirty_rect_mode = dirty_rect_mode
+        self.dirty_rects = []
+
+        # In dirty rectangle mode, the screen only needs to be redrawn when a different menu is shown,
+        # otherwise, what was drawn in the previous frame is still on the screen:
+        if dirty_rect_mode and views is self.current_views and background_colour == self.background_colour: return
+
+        self.screen.fill(background_colour)
+        self.background_colour = background_colour
+        self.current_views = views
+        self.redraw_count += 1
+        self.add_dirty_rect(self.rect)
+
+    def end_frame(self):
+        if self.dirty_rect_mode:
+            # Only updating the areas of the screen that have changed:
+            pygame.display.update(self.dirty_rects)
+        else:
+            pygame.display.flip()
+
+    def is_dirty_rect_mode(self):
+        return self.dirty_rect_mode
+
+    def get_redraw_count(self):
+        return self.redraw_count
+
+    def add_dirty_rect(self, rect):
+        self.dirty_rects.append(rect)
+
+    def clear_rect(self, rect):
+        # Drawing the background over an area so that something else can be drawn there:
+        self.screen.fill(self.background_colour, rect)
+        self.add_dirty_rect(rect)
 
     def quit(self):
         # Saving player data:
@@ -85,7 +163,23 @@ class Game:  # [TESTED & FINALISED]
     def refresh_current_level(self):
         # Setting up level:
         level_id = self.database_helper.get_player_stats()[Player.CURRENT_LEVEL_ID]
-        self.current_level = Level(self, level_id)
+        # Using the map of the level if it has been loaded in the background:
+        self.current_level = Level(self, level_id, self.level_preloader.get_map_data(level_id))
+        # Decoding the music of the level in the background, so that it is ready when the level starts:
+        self.music_player.prefetch(Utils().get_music(level_id))
+
+    def preload_level(self, level_id):
+        # Starts loading the map of a level in the background, so that it is ready when the level is played:
+        if level_id not in Utils().LEVELS.keys():
+            level_id = 0
+        self.level_preloader.start(level_id)
+
+    def restart_current_level(self):
+        # Restarting the current level in place, which is much faster than setting it up again.
+        # Returns whether this was possible, which it is not if the level to be played has a different id:
+        level_id = self.database_helper.get_player_stats()[Player.CURRENT_LEVEL_ID]
+        if self.current_level is None or self.current_level.get_id() != level_id: return False
+        return self.current_level.restore_snapshot()
 
     def refresh_settings(self):
         # Getting the frame rate cap setting from the database:
@@ -96,7 +190,7 @@ class Game:  # [TESTED & FINALISED]
 
         # Getting the audio volume level:
         self.audio_volume = self.database_helper.get_setting(DatabaseHelper.AUDIO_VOLUME)
-        self.current_music.set_volume(self.audio_volume * self.MUSIC_VOLUME_MULTIPLIER)
+        self.music_player.set_volume(self.audio_volume * self.MUSIC_VOLUME_MULTIPLIER)
         # Setting up level:
         self.refresh_current_level()
 
@@ -110,12 +204,24 @@ class Game:  # [TESTED & FINALISED]
         return self.clock.get_fps()
 
     def get_current_frame_time(self):
-        frame_rate = self.clock.get_fps()
-        # Avoiding division by zero:
-        if frame_rate != 0:
-            return 1 / frame_rate
-        else:
-            return 1
+        # Everything in the level is simulated in steps of the same length, whatever the frame rate is,
+        # so movement and damage do not depend on it:
+        return 1 / self.SIMULATION_RATE
+
+    def get_simulation_time(self):
+        return self.simulation_time
+
+    def update_current_level(self):
+        # Simulating the level in fixed steps for the time that has passed since the last frame:
+        # At high frame rates, some frames do not need any steps, and at low frame rates, some need several.
+        self.unsimulated_time = min(self.unsimulated_time + self.clock.get_time() / 1000, self.MAX_SIMULATION_TIME)
+        while self.unsimulated_time >= self.get_current_frame_time() and not self.current_level.is_done():
+            self.current_level.simulate()
+            self.simulation_time += 1000 / self.SIMULATION_RATE
+            self.unsimulated_time -= self.get_current_frame_time()
+
+        # Then drawing the level as it is after the steps, once per frame:
+        self.current_level.draw()
 
     def set_frame_rate(self, frame_rate):
         self.frame_rate = frame_rate
@@ -139,14 +245,18 @@ class Game:  # [TESTED & FINALISED]
         # Updating the database:
         self.database_helper.update_setting(DatabaseHelper.AUDIO_VOLUME, audio_volume)
         # Setting the volume of all the sounds:
-        self.current_music.set_volume(audio_volume * self.MUSIC_VOLUME_MULTIPLIER)
+        self.music_player.set_volume(audio_volume * self.MUSIC_VOLUME_MULTIPLIER)
+
+    def get_asset_pack(self):
+        return self.asset_pack
+
+    def play_sound(self, sound_path):
+        # Playing a sound effect at the current audio volume:
+        self.sound_bank.play(sound_path, self.audio_volume)
 
     def set_music(self, music, fade_out=1000, fade_in=1000):
-        # Expensive - 0.25s per call:
-        self.current_music.fadeout(fade_out)
-        self.current_music = pygame.mixer.Sound(music)
-        self.current_music.set_volume(self.audio_volume * self.MUSIC_VOLUME_MULTIPLIER)
-        self.current_music.play(fade_ms=fade_in, loops=-1)
+        # Crossfading to the new track, which is decoded in the background if it has not been prefetched:
+        self.music_player.play(music, fade_out=fade_out, fade_in=fade_in)
 
     def get_key_down_events(self):
         return self.key_down_events
@@ -233,7 +343,7 @@ class Game:  # [TESTED & FINALISED]
         # <!> __UI LAYOUT__ <!>
 
         while not self.done:
-            self.screen.fill(WHITE)
+            self.start_frame(WHITE, views)
             self.update()
 
             if self.key_pressed(pygame.K_1):
@@ -264,7 +374,7 @@ class Game:  # [TESTED & FINALISED]
                 self.quit()
 
             for view in views: view.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
     def show_settings_menu(self):
@@ -361,7 +471,7 @@ class Game:  # [TESTED & FINALISED]
         # <!> __UI LAYOUT__ <!>
 
         while not self.done:
-            self.screen.fill(WHITE)
+            self.start_frame(WHITE, views)
             self.update()
 
             # If the frame rate has been changed and the frame rate input is not empty, setting it to the attribute:
@@ -389,7 +499,7 @@ class Game:  # [TESTED & FINALISED]
                 return
 
             for view in views: view.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
     def show_information(self):
@@ -427,7 +537,7 @@ class Game:  # [TESTED & FINALISED]
         # <!> __UI LAYOUT__ <!>
 
         while not self.done:
-            self.screen.fill(WHITE)
+            self.start_frame(WHITE, views)
             self.update()
 
             # Exit if exit button or escape clicked, returning to the previous menu:
@@ -435,7 +545,7 @@ class Game:  # [TESTED & FINALISED]
                 return
 
             for view in views: view.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
     def show_character_menu(self):
@@ -529,7 +639,7 @@ class Game:  # [TESTED & FINALISED]
         # <!> __UI LAYOUT__ <!>
 
         while not self.done:
-            self.screen.fill(WHITE)
+            self.start_frame(WHITE, views)
             self.update()
 
             if self.key_pressed(pygame.K_ESCAPE):
@@ -566,7 +676,7 @@ class Game:  # [TESTED & FINALISED]
                 txt_warning.set_visibility(False)
 
             for view in views: view.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
     def show_game(self):
@@ -574,6 +684,9 @@ class Game:  # [TESTED & FINALISED]
         level_id = self.current_level.get_id()
         self.set_music(Utils().get_music(level_id))
         background_colour = Utils().get_level_colour(level_id)
+        # Decoding the music that may be needed next whilst the level is being played:
+        self.music_player.prefetch(DEATH_MUSIC)
+        self.music_player.prefetch(Utils().get_music(level_id + 1 if level_id + 1 in Utils().LEVELS else 0))
 
         # The map set-up should be done after the character creation menu so that we have the correct player.
         # So it is not done when the level is instantiated, but when the game is first shown:
@@ -651,11 +764,21 @@ class Game:  # [TESTED & FINALISED]
                            frame_condition=View.ALWAYS)
         views.append(btn_trash)
 
+        # Minimap:
+        mm_level = Minimap(self, self.current_level.get_minimap_image(), self.current_level.get_map_size(),
+                           size=(Level.MINIMAP_SIZE, Level.MINIMAP_SIZE))
+        # This should be aligned with the bottom left corner of the screen:
+        mm_level.get_rect().bottomleft = self.rect.bottomleft + pygame.Vector2(mm_level.get_margin(),
+                                                                               -mm_level.get_margin())
+        mm_level.calculate_position()
+        views.append(mm_level)
+
         # <!> __UI LAYOUT__ <!>
 
         while (not self.done) and (not self.current_level.is_done()):
-            self.screen.fill(background_colour)
-            self.current_level.update()
+            # The game changes every frame, so the whole screen is redrawn:
+            self.start_frame(background_colour, views, dirty_rect_mode=False)
+            self.update_current_level()
 
             # If escape or the pause button is clicked, returning to the previous menu:
             if self.key_pressed(pygame.K_ESCAPE) or btn_pause.clicked():
@@ -665,7 +788,8 @@ class Game:  # [TESTED & FINALISED]
             # If tab or the switch item button is clicked, incrementing the item selected by the player:
             elif self.key_pressed(pygame.K_TAB) or btn_switch.clicked():
                 player.increment_item_selected()
-            if btn_use.clicked():
+            # Space can only be used to use the item if it is not already in use:
+            if btn_use.clicked() or (self.key_pressed(pygame.K_SPACE) and not player.get_item_selected().is_in_use()):
                 player.use_item()
             elif btn_trash.clicked():
                 player.destroy_item(player.get_item_selected())
@@ -677,22 +801,26 @@ class Game:  # [TESTED & FINALISED]
             btn_use.set_icon(player.get_item_selected().get_icon())
             # Updating the health progress:
             pr_health.set_progress(player.get_stats()[Player.CURRENT_HEALTH] / player.get_stats()[Player.FULL_HEALTH])
+            # Updating the positions of the markers on the minimap:
+            mm_level.set_markers(self.current_level.get_minimap_markers())
 
             for view in views: view.update()
             # Putting update at the bottom so the FPS counter is always visible:
             self.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
             # If the level is done but the game is not, looking at which level should be played:
             if self.current_level.is_done():
-                # Checking which level should be played from the database:
-                self.refresh_current_level()
+                # Checking which level should be played from the database,
+                # restarting the current level if it is the same one:
+                if not self.restart_current_level(): self.refresh_current_level()
                 # Updating background colour, music, setting up level and obtaining player:
                 self.set_music(Utils().get_music(self.current_level.get_id()))
                 background_colour = Utils().get_level_colour(self.current_level.get_id())
                 self.current_level.set_up_map()
                 player = self.current_level.get_player()
+                mm_level.set_map(self.current_level.get_minimap_image(), self.current_level.get_map_size())
 
     def show_death_screen(self):
         views = []
@@ -721,7 +849,7 @@ class Game:  # [TESTED & FINALISED]
         # <!> __UI LAYOUT__ <!>
 
         while not self.done:
-            self.screen.fill(BLACK)
+            self.start_frame(BLACK, views)
             self.update()
 
             # Going back to the previous menu if escape or the quit button is clicked:
@@ -733,7 +861,7 @@ class Game:  # [TESTED & FINALISED]
                 self.done = True
 
             for view in views: view.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
     def test_1(self):
@@ -811,7 +939,7 @@ class Game:  # [TESTED & FINALISED]
         views.append(btn_back)
 
         while not self.done:
-            self.screen.fill(WHITE)
+            self.start_frame(WHITE, views)
             self.update()
 
             if self.key_pressed(pygame.K_ESCAPE): return
@@ -850,7 +978,7 @@ class Game:  # [TESTED & FINALISED]
                 self.test_2()
 
             for view in views: view.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
     def test_2(self):
@@ -869,13 +997,13 @@ class Game:  # [TESTED & FINALISED]
         views.append(btn_continue)
 
         while not self.done:
-            self.screen.fill(WHITE)
+            self.start_frame(WHITE, views)
             self.update()
 
             if self.key_pressed(pygame.K_ESCAPE): return
 
             for view in views: view.update()
-            pygame.display.flip()
+            self.end_frame()
             self.clock.tick(self.frame_rate)
 
 
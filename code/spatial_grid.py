@@ -0,0 +1,107 @@
+# A uniform grid that indexes tiles by the cells their rectangles overlap:
+# Used to find the tiles within an area without checking every tile in the level.
+class SpatialGrid:
+
+    # Tiles are indexed by their rectangles unless a different function of the tile returning a rectangle is provided,
+    # such as for indexing tiles by their colliders:
+    def __init__(self, cell_size, rect_function=None):
+        # The length of each (square) cell in pixels:
+        self.cell_size = max(1, int(cell_size))
+
+        # A dictionary of (column, row) cell coordinates and the set of tiles overlapping each cell:
+        self.cells = {}
+
+        # The range of cells each tile is currently stored in, as (left, top, right, bottom):
+        # Used to remove a tile, and to determine whether a tile needs to be moved between cells:
+        self.tile_cells = {}
+
+        # The order in which tiles were inserted:
+        # Query results are returned in this order, so that tiles are processed in the same order as the lists.
+        self.order = {}
+        self.order_count = 0
+
+        self.rect_function = rect_function if rect_function is not None else lambda tile: tile.get_rect()
+
+    def get_cell_range(self, rect):
+        # Returns the range of cells that a rectangle overlaps:
+        # Rectangles with no width or height still occupy the cell their top left is in:
+        return (rect.left // self.cell_size, rect.top // self.cell_size,
+                max(rect.left, rect.right - 1) // self.cell_size, max(rect.top, rect.bottom - 1) // self.cell_size)
+
+    def add_to_cells(self, tile, cell_range):
+        left, top, right, bottom = cell_range
+        for column in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                cell = self.cells.get((column, row))
+                if cell is None:
+                    cell = self.cells[(column, row)] = set()
+                cell.add(tile)
+
+        self.tile_cells[tile] = cell_range
+
+    def remove_from_cells(self, tile):
+        left, top, right, bottom = self.tile_cells.pop(tile)
+        for column in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                cell = self.cells[(column, row)]
+                cell.discard(tile)
+                # Not keeping empty cells, so that the dictionary only grows with the occupied area:
+                if len(cell) == 0: del self.cells[(column, row)]
+
+    def insert(self, tile):
+        # A tile can only be stored once:
+        if tile in self.tile_cells: return
+
+        self.order[tile] = self.order_count
+        self.order_count += 1
+        self.add_to_cells(tile, self.get_cell_range(self.rect_function(tile)))
+
+    def remove(self, tile):
+        if tile not in self.tile_cells: return
+
+        self.remove_from_cells(tile)
+        del self.order[tile]
+
+    def move(self, tile):
+        # Must be called whenever the rectangle of a tile in the grid changes:
+        cell_range = self.tile_cells.get(tile)
+        # The tile is not in the grid:
+        if cell_range is None: return
+
+        new_cell_range = self.get_cell_range(self.rect_function(tile))
+        # Most movements do not leave the current cells, in which case there is nothing to do:
+        if new_cell_range == cell_range: return
+
+        self.remove_from_cells(tile)
+        self.add_to_cells(tile, new_cell_range)
+
+    def get_tiles(self):
+        # Returns all tiles in the grid, in the order they were inserted:
+        return sorted(self.tile_cells, key=self.order.__getitem__)
+
+    def clear(self):
+        self.cells.clear()
+        self.tile_cells.clear()
+        self.order.clear()
+
+    def __contains__(self, tile):
+        return tile in self.tile_cells
+
+    def __len__(self):
+        return len(self.tile_cells)
+
+    def query(self, rect):
+        # Returns the tiles whose indexed rectangles collide with the specified rectangle,
+        # in the order they were inserted:
+        left, top, right, bottom = self.get_cell_range(rect)
+        candidates = set()
+
+        for column in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                cell = self.cells.get((column, row))
+                if cell is not None: candidates.update(cell)
+
+        # The cells only narrow down the search, so the rectangles still need to be checked:
+        colliding = [tile for tile in candidates if self.rect_function(tile).colliderect(rect)]
+        colliding.sort(key=self.order.__getitem__)
+        return colliding
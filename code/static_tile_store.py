@@ -0,0 +1,135 @@
+import numpy as np
+
+
+# Keeps the geometry of tiles that never move in arrays, one entry per tile:
+# Used to find the static tiles within an area with a few array operations instead of a loop over the tiles,
+# so that the tile objects only need to be looked at if they are actually going to be used.
+class StaticTileStore:
+    # Flags for the groups a tile belongs to, which can be combined:
+    FLAT = 1
+    DEPTH = 2
+
+    def __init__(self, depth_key):
+        # The tiles, their images and flags, in the order they were added:
+        self.tiles = []
+        self.images = []
+        self.flag_list = []
+
+        # The index of each tile in the lists above:
+        self.tile_indices = {}
+
+        # A function of the tile that depth tiles are drawn in ascending order of:
+        self.depth_key = depth_key
+
+        # The arrays are only created when they are needed after tiles have been added, removed or moved,
+        # which is almost always just once when the map is set up:
+        self.built = False
+
+        # Rectangles of each tile as (x, y, width, height):
+        self.rects = np.zeros((0, 4), dtype=np.int64)
+        # The right and bottom edges of the rectangles, so that they do not need to be calculated for each query:
+        self.rights = np.zeros(0, dtype=np.int64)
+        self.bottoms = np.zeros(0, dtype=np.int64)
+        self.flags = np.zeros(0, dtype=np.uint8)
+        self.depths = np.zeros(0, dtype=np.int64)
+        # The indices of the tiles in ascending order of depth, with ties in the order they were added:
+        self.depth_order = np.zeros(0, dtype=np.int64)
+
+    def add(self, tile, flags):
+        # A tile can only be stored once, so any new flags are combined with the existing ones:
+        index = self.tile_indices.get(tile)
+        if index is not None:
+            self.set_flags(tile, self.flag_list[index] | flags)
+            return
+
+        self.tile_indices[tile] = len(self.tiles)
+        self.tiles.append(tile)
+        self.images.append(tile.image)
+        self.flag_list.append(flags)
+        self.built = False
+
+    def remove(self, tile):
+        index = self.tile_indices.pop(tile, None)
+        if index is None: return
+
+        del self.tiles[index]
+        del self.images[index]
+        del self.flag_list[index]
+        # The tiles after the removed tile have moved back by one:
+        for other_index in range(index, len(self.tiles)): self.tile_indices[self.tiles[other_index]] = other_index
+        self.built = False
+
+    def move(self, tile):
+        # Must be called whenever the rectangle or image of a stored tile changes:
+        index = self.tile_indices.get(tile)
+        if index is None: return
+
+        self.images[index] = tile.image
+        self.built = False
+
+    def set_flags(self, tile, flags):
+        index = self.tile_indices[tile]
+        self.flag_list[index] = flags
+        # The flags can be changed without creating the arrays again:
+        if self.built: self.flags[index] = flags if self.rects[index, 2] > 0 and self.rects[index, 3] > 0 else 0
+
+    def get_flags(self, tile):
+        return self.flag_list[self.tile_indices[tile]] if tile in self.tile_indices else 0
+
+    def __contains__(self, tile):
+        return tile in self.tile_indices
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def build(self):
+        rects = [tile.get_rect() for tile in self.tiles]
+
+        self.rects = np.array([(rect.x, rect.y, rect.width, rect.height) for rect in rects],
+                              dtype=np.int64).reshape(-1, 4)
+        self.rights = self.rects[:, 0] + self.rects[:, 2]
+        self.bottoms = self.rects[:, 1] + self.rects[:, 3]
+
+        # Rectangles without an area never collide with anything, so they are left out of every group:
+        self.flags = np.array(self.flag_list, dtype=np.uint8)
+        self.flags[(self.rects[:, 2] <= 0) | (self.rects[:, 3] <= 0)] = 0
+
+        # Sorting by depth first and then by the order the tiles were added:
+        self.depths = np.array([self.depth_key(tile) for tile in self.tiles], dtype=np.int64)
+        self.depth_order = np.lexsort((np.arange(len(self.tiles)), self.depths))
+
+        self.built = True
+
+    def get_mask(self, rect, flag):
+        # Returns whether each tile is in the group and its rectangle collides with the specified rectangle:
+        if not self.built: self.build()
+
+        # Like the rectangles of the tiles, a rectangle without an area does not collide with anything:
+        if rect.width <= 0 or rect.height <= 0: return np.zeros(len(self.tiles), dtype=bool)
+
+        return (((self.flags & flag) != 0) &
+                (self.rects[:, 0] < rect.right) & (self.rights > rect.left) &
+                (self.rects[:, 1] < rect.bottom) & (self.bottoms > rect.top))
+
+    def query_indices(self, rect, flag):
+        # Returns the indices of the tiles in the group that collide with the rectangle.
+        # Depth tiles are returned in ascending order of depth, and others in the order they were added:
+        mask = self.get_mask(rect, flag)
+        if flag == self.DEPTH: return self.depth_order[mask[self.depth_order]]
+        return np.flatnonzero(mask)
+
+    def get_tiles(self, indices):
+        return [self.tiles[index] for index in indices.tolist()]
+
+    def get_depths(self, indices):
+        return self.depths[indices]
+
+    def write_draw_commands(self, commands, index, indices, offset):
+        # Writes (image, screen position) pairs for the tiles into the commands from the index,
+        # and returns the index after them. The positions are calculated for all of the tiles at once
+        # by adding the draw offset to their rectangles:
+        positions = (self.rects[indices, :2] + offset).tolist()
+        for tile_index, position in zip(indices.tolist(), positions):
+            commands[index] = (self.images[tile_index], position)
+            index += 1
+        return index
@@ -0,0 +1,66 @@
+import pygame
+
+
+# Packs many small images into a few large surfaces (pages), giving back a subsurface for each image: [DONE]
+# Images that are used together, such as the animation frames of characters, then share the same few surfaces,
+# which takes less memory than many separate surfaces, and lets them be drawn as areas of the same surface.
+class TextureAtlas:
+    # The length of each (square) page in pixels:
+    PAGE_SIZE = 1024
+
+    def __init__(self, page_size=PAGE_SIZE):
+        self.page_size = page_size
+        self.pages = []
+
+        # Images are placed from left to right in rows, starting a new row when the current one is full.
+        # The position of the next image on the current page, and the height of the tallest image in the current row:
+        self.x = 0
+        self.y = 0
+        self.row_height = 0
+
+    def add_page(self):
+        # Pages start off fully transparent:
+        self.pages.append(pygame.Surface((self.page_size, self.page_size), pygame.SRCALPHA).convert_alpha())
+        self.x = 0
+        self.y = 0
+        self.row_height = 0
+
+    def add(self, image):
+        width, height = image.get_size()
+        # Images that are empty or do not fit on a page are kept as they are:
+        if width == 0 or height == 0 or width > self.page_size or height > self.page_size: return image
+
+        # Starting a new row if the image does not fit at the end of the current one,
+        # and a new page if the image does not fit below the current row:
+        if self.x + width > self.page_size:
+            self.x = 0
+            self.y += self.row_height
+            self.row_height = 0
+        if len(self.pages) == 0 or self.y + height > self.page_size: self.add_page()
+
+        page = self.pages[-1]
+        # The page is transparent, so taking the maximum of each value copies the pixels exactly, without blending:
+        page.blit(image, (self.x, self.y), special_flags=pygame.BLEND_RGBA_MAX)
+        region = page.subsurface((self.x, self.y, width, height))
+
+        self.x += width
+        self.row_height = max(self.row_height, height)
+        return region
+
+
+# Packs a few images that are always used together, such as the frames of an animation, into a single surface:
+# Unlike a page of an atlas, the surface only belongs to these images, so it is freed once they are no longer used.
+def pack_images(images):
+    width = sum(image.get_width() for image in images)
+    height = max([image.get_height() for image in images], default=0)
+    if width == 0 or height == 0: return list(images)
+
+    surface = pygame.Surface((width, height), pygame.SRCALPHA).convert_alpha()
+    regions = []
+    x = 0
+    for image in images:
+        # The surface is transparent, so taking the maximum of each value copies the pixels exactly:
+        surface.blit(image, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+        regions.append(surface.subsurface((x, 0), image.get_size()))
+        x += image.get_width()
+    return regions
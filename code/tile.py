@@ -1,5 +1,5 @@
 import pygame
-from utils import resize_image
+from utils import get_scaled_image, get_image_mask, get_blank_image
 from colours import *
 
 
@@ -9,17 +9,27 @@ class Tile(pygame.sprite.Sprite):  # [TESTED & FINALISED]
     # The collider ratio is the ratio of the size of the object the collider should be.
     # This is used to create an overlap effect, and to also allow interactions
     # such as characters moving behind the leaves of a tree.
+    # The image id identifies the source image, so that tiles with the same image can share the scaled version.
+    # With a mask collider, characters only collide with the opaque pixels of the image,
+    # which suits irregular objects such as buildings better than a rectangle:
     def __init__(self, game, position=(0, 0), size=(1, 1),
-                 collider_ratio=(0.9, 0.9), image=None, protect_aspect_ratio=True):
+                 collider_ratio=(0.9, 0.9), image=None, protect_aspect_ratio=True, image_id=None,
+                 mask_collider=False):
         super().__init__()
 
         # Attributes for game and level:
         self.game = game
+        self.display = pygame.display.get_surface()
         self.level = game.get_current_level()
         self.tile_size = self.level.get_tile_size()
 
         # What ratio of the image the collider should occupy - this allows objects to partially overlap each other:
-        self.collider_ratio = collider_ratio
+        # A mask collider covers the whole image, so that the mask lines up with it.
+        self.collider_ratio = (1, 1) if mask_collider else collider_ratio
+
+        # Whether the tile has a mask collider, and the mask of its image if it does:
+        self.mask_collider = mask_collider
+        self.mask = None
 
         # The size of the rectangle of the object can change with the image size, but the maximum size does not:
         self.max_size = self.tile_to_pixel(size)
@@ -27,10 +37,11 @@ class Tile(pygame.sprite.Sprite):  # [TESTED & FINALISED]
 
         # Whether to maintain the aspect ratio of the image when resizing it:
         self.protect_aspect_ratio = protect_aspect_ratio
-        # If there is no image, then the tile will be a blank rectangle:
-        if image is None: image = pygame.Surface(self.max_size)
-        # Setting the image and adjusting its size:
-        self.set_image(image)
+        # If there is no image, then the tile will be a blank rectangle, which is already the right size.
+        # The blank image is shared, since children such as items and characters replace it with their own:
+        if image is None: self.set_resized_image(get_blank_image(self.max_size))
+        # Otherwise, setting the image and adjusting its size:
+        else: self.set_image(image, image_id=image_id)
 
         # When the tile moves, the collider is moved first and is used to check for collisions.
         # Then, the rectangle is moved to match with the collider.
@@ -44,13 +55,16 @@ class Tile(pygame.sprite.Sprite):  # [TESTED & FINALISED]
         # Converts a size in tiles to pixels:
         return [dimension * self.tile_size for dimension in size]
 
-    def set_image(self, image):
-        if self.protect_aspect_ratio:
-            # Resizing the tile image whilst protecting the aspect ratio:
-            self.image = resize_image(image, self.max_size)
-        else:
-            # Resizing the image without protecting the aspect ratio:
-            self.image = pygame.transform.scale(image, self.max_size)
+    def set_image(self, image, image_id=None):
+        # Resizing the tile image, sharing the result with other tiles using the same image if it has an id:
+        self.set_resized_image(get_scaled_image(image, self.max_size, self.protect_aspect_ratio, image_id,
+                                                self.game.get_asset_pack()))
+
+    def set_resized_image(self, image):
+        # Sets an image that is already the right size, such as one shared between tiles, without resizing it:
+        self.image = image
+        # The mask is shared between all the tiles with the same scaled image:
+        if self.mask_collider: self.mask = get_image_mask(self.image)
 
         # Calculating the new size of the rectangle:
         self.rect.size = self.image.get_size()
@@ -70,6 +84,10 @@ class Tile(pygame.sprite.Sprite):  # [TESTED & FINALISED]
     def get_collider(self):
         return self.collider
 
+    def get_mask(self):
+        # Returns the mask of the opaque pixels of the image, or None if the whole collider is solid:
+        return self.mask
+
     def get_rect(self):
         return self.rect
 
@@ -78,6 +96,19 @@ class Tile(pygame.sprite.Sprite):  # [TESTED & FINALISED]
         # Useful for placing the tile onto the map, since the top left positions are provided in this case:
         self.rect.topleft = position
         self.collider.topleft = position
+        # Keeping the spatial grids of the level up to date:
+        self.level.move_tile(self)
+
+    def get_state(self):
+        # The attributes of the tile that can change whilst the level is played,
+        # so that the tile can be put back how it was when the level is restarted:
+        return {"rect": self.rect.copy(), "collider": self.collider.copy(), "image": self.image}
+
+    def set_state(self, state):
+        # The spatial grids of the level are rebuilt after all tiles have been restored, so they are not updated here:
+        self.rect.update(state["rect"])
+        self.collider = state["collider"].copy()
+        self.image = state["image"]
 
     def draw_collider(self, draw_offset):
         # The image of the collider (for debugging, testing etc.):
@@ -86,9 +117,14 @@ class Tile(pygame.sprite.Sprite):  # [TESTED & FINALISED]
         self.collider_image.set_alpha(128)
         self.collider_image.fill(RED)
         # Drawing the collider:
-        pygame.display.get_surface().blit(self.collider_image, self.collider.topleft + draw_offset)
+        self.display.blit(self.collider_image, self.collider.topleft + draw_offset)
+
+    def draw_overlay(self):
+        # Anything that should be drawn on top of the map once it has been drawn - overridden by children:
+        pass
 
     def draw(self, draw_offset):
-        pygame.display.get_surface().blit(self.image, self.rect.topleft + draw_offset)
+        # Level.draw_map does not use this method, since it draws all the tiles in frame at once:
+        self.display.blit(self.image, (self.rect.x + draw_offset[0], self.rect.y + draw_offset[1]))
         # Drawing the collider (for debugging, testing etc.):
         # self.draw_collider(draw_offset)
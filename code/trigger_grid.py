@@ -0,0 +1,76 @@
+from spatial_grid import SpatialGrid
+
+
+# Areas of the map that something happens in when a tile enters or leaves them, such as items being picked up:
+# The triggers are kept in a spatial grid, so only the triggers in the cells a tile is in need to be checked,
+# and nothing needs to be checked at all whilst the tile is away from every trigger.
+class TriggerGrid:
+
+    def __init__(self, cell_size):
+        # A dictionary of the keys of the triggers and functions returning their rectangles,
+        # so that a trigger can follow the tile it belongs to:
+        self.rect_functions = {}
+        # A dictionary of the keys of the triggers and the functions called with the tile entering or leaving them:
+        self.enter_callbacks = {}
+        self.exit_callbacks = {}
+
+        self.grid = SpatialGrid(cell_size, rect_function=lambda key: self.rect_functions[key]())
+
+        # A dictionary of the tiles that are checked against the triggers and the keys of the triggers they are in:
+        self.triggers_entered = {}
+
+    def add(self, key, rect_function, on_enter=None, on_exit=None):
+        # Each key, such as the tile the trigger belongs to, can only have one trigger:
+        self.remove(key)
+
+        self.rect_functions[key] = rect_function
+        self.enter_callbacks[key] = on_enter
+        self.exit_callbacks[key] = on_exit
+        self.grid.insert(key)
+
+    def remove(self, key):
+        if key not in self.rect_functions: return
+
+        # A trigger that is removed is not left, so the exit function is not called:
+        self.grid.remove(key)
+        del self.rect_functions[key]
+        del self.enter_callbacks[key]
+        del self.exit_callbacks[key]
+        for triggers_entered in self.triggers_entered.values(): triggers_entered.discard(key)
+
+    def move(self, key):
+        # Must be called whenever the rectangle of a trigger changes:
+        self.grid.move(key)
+
+    def clear(self):
+        self.grid.clear()
+        self.rect_functions.clear()
+        self.enter_callbacks.clear()
+        self.exit_callbacks.clear()
+        self.triggers_entered.clear()
+
+    def __contains__(self, key):
+        return key in self.rect_functions
+
+    def update(self, tile, rect):
+        # Calls the functions of the triggers that the rectangle of the tile has entered or left since the last update:
+        triggers_entered = self.triggers_entered.setdefault(tile, set())
+        colliding = self.grid.query(rect)
+        if len(colliding) == 0 and len(triggers_entered) == 0: return
+
+        # The functions may add or remove triggers, so the changes are found before any of them are called:
+        colliding_keys = set(colliding)
+        left = [key for key in triggers_entered if key not in colliding_keys]
+        entered = [key for key in colliding if key not in triggers_entered]
+
+        for key in left:
+            # An earlier function may have removed the trigger:
+            if key not in self.rect_functions: continue
+            triggers_entered.discard(key)
+            if self.exit_callbacks[key] is not None: self.exit_callbacks[key](tile)
+
+        for key in entered:
+            # An earlier function may have removed the trigger:
+            if key not in self.rect_functions: continue
+            triggers_entered.add(key)
+            if self.enter_callbacks[key] is not None: self.enter_callbacks[key](tile)
@@ -1,4 +1,6 @@
 from main import *
+from spatial_grid import SpatialGrid
+from trigger_grid import TriggerGrid
 import unittest
 from unittest.mock import patch
 
@@ -182,15 +184,370 @@ class TestPlayer(unittest.TestCase):
         print("\n\033[1mUnit Test for Character.handle_collision():")
         for index, test in enumerate(test_data):
             print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test} :", end="\t\t")
-            # Normally, the player only checks collision with tiles that are visible on-screen.
-            # For this test, we are not concerned with the screen,
-            # so setting the tiles visible on-screen as all the tiles:
-            self.player.level.get_obstacle_tiles_in_frame = lambda: self.level.obstacle_tiles
+            # The player checks collision with the obstacles near it, wherever it is on the map,
+            # so the screen does not need to be moved for this test:
             self.player.collider.center = test[0]
             collision = self.player.handle_collision(0) or self.player.handle_collision(1)
             self.assertIs(collision, test[1])
             print(f"\033[92m\033[1mPassed")
 
+    def test_sweep(self):
+        # Testing that a character moving any distance in one frame stops at the first obstacle in its way,
+        # so that it cannot pass through thin obstacles:
+
+        # Test data list where each element is a list of 4 elements:
+        #   1. The axis the player moves along (0 for x, 1 for y)
+        #   2. The displacement the player tries to move by, from a collider at (0, 0) with a size of 40x40
+        #   3. The colliders (x, y, width, height) of the obstacles
+        #   4. The displacement the player is expected to be able to move by
+        test_data = [[0, 500, [(200, 0, 1, 40)], 160],
+                     [0, 500, [(300, 0, 1, 40), (200, 10, 1, 5)], 160],
+                     [0, -500, [(-100, 0, 1, 40)], -99],
+                     [1, 500, [(0, 300, 40, 1)], 260],
+                     [1, -500, [(-20, -102, 50, 2)], -100],
+                     [0, 500, [(200, 40, 1, 40), (200, -40, 1, 40)], 500],
+                     [0, 500, [(-50, 0, 1, 40)], 500],
+                     [0, 500, [(200, 0, 0, 40)], 500],
+                     [0, 500, [(40, 0, 10, 40)], 0],
+                     [1, 30, [(0, 100, 40, 40)], 30],
+                     ]
+
+        print("\n\033[1mUnit Test for Character.sweep():")
+        for index, test in enumerate(test_data):
+            print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test} :", end="\t\t")
+            self.player.collider = pygame.Rect(0, 0, 40, 40)
+            obstacles = []
+            for collider in test[2]:
+                obstacle = Tile(self.game)
+                obstacle.collider = pygame.Rect(collider)
+                obstacles.append(obstacle)
+
+            displacement = self.player.sweep(test[0], test[1], obstacles)
+            self.assertEqual(displacement, test[3])
+
+            # The area the player moves through does not reach into any of the obstacles:
+            swept_rect = self.player.collider.union(self.player.collider.move(
+                (displacement, 0) if test[0] == 0 else (0, displacement)))
+            self.assertEqual(swept_rect.collidelist([obstacle.get_collider() for obstacle in obstacles
+                                                     if obstacle.get_collider().width > 0]), -1)
+            print(f"\033[92m\033[1mPassed")
+
+    def test_mask_collision(self):
+        # Testing that a character only collides with the opaque pixels of an obstacle with a mask collider,
+        # and can move through the transparent parts of its rectangle:
+
+        # An obstacle of 2x2 tiles away from the rest of the map, with an opaque left half and a transparent right half:
+        tile_size = self.level.get_tile_size()
+        image = pygame.Surface((2 * tile_size, 2 * tile_size), pygame.SRCALPHA)
+        image.fill(BLACK, (0, 0, tile_size, 2 * tile_size))
+        obstacle = Tile(self.game, position=(-5000, -5000), size=(2, 2), image=image, mask_collider=True)
+        self.level.add_tile(obstacle, visible=False, obstacle=True)
+        left, top = obstacle.get_collider().topleft
+
+        # Test data list where each element is a list of 4 elements:
+        #   1. The top left of the player's collider, relative to the obstacle
+        #   2. The direction the player moves in
+        #   3. The number of pixels the player tries to move
+        #   4. The top left of the player's collider expected after moving, relative to the obstacle
+        test_data = [[(-100, 20), (1, 0), 50, (-tile_size, 20)],
+                     [(tile_size, 20), (-1, 0), 20, (tile_size, 20)],
+                     [(tile_size, 20), (0, 1), 30, (tile_size, 50)],
+                     [(2 * tile_size + 8, 20), (-1, 0), 50, (2 * tile_size - 42, 20)],
+                     [(0, -90), (0, 1), 30, (0, -tile_size)],
+                     [(tile_size, -90), (0, 1), 30, (tile_size, -60)],
+                     [(0, 2 * tile_size + 10), (0, -1), 30, (0, 2 * tile_size)],
+                     ]
+
+        print("\n\033[1mUnit Test for Character.handle_collision() with mask colliders:")
+        for index, test in enumerate(test_data):
+            print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test} :", end="\t\t")
+            self.player.collider.topleft = (left + test[0][0], top + test[0][1])
+            self.player.direction = pygame.math.Vector2(test[1])
+            self.player.displacement_deficit = [0, 0]
+            # The speed at which the player moves the number of pixels in one step:
+            self.player.move((test[2] + 0.5) / (tile_size * self.game.get_current_frame_time()))
+            self.assertEqual(self.player.collider.topleft, (left + test[3][0], top + test[3][1]))
+            print(f"\033[92m\033[1mPassed")
+
+
+class TestLevelSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        # Setting up a level, which records its snapshot once the map has been set up:
+        self.game = Game()
+        self.level = Level(self.game, 1)
+        self.game.current_level = self.level
+        self.level.set_up_map()
+
+        self.player = self.level.get_player()
+        self.enemy, self.killed_enemy = self.level.hostile_tiles[:2]
+        self.ground_item = self.level.item_tiles[0]
+        self.enemy_item = list(self.enemy.get_inventory())[0]
+
+    def test_restore_snapshot(self):
+        # Testing that restoring the snapshot puts the level back to how it was when the map was set up,
+        # after the player and enemies have moved, been damaged and killed, and items have been picked up and dropped:
+
+        # Recording the level before it is played:
+        player_position = self.player.get_rect().topleft
+        enemy_position = self.enemy.get_rect().topleft
+        enemy_health = self.enemy.get_stats()[Character.CURRENT_HEALTH]
+        player_full_health = self.player.get_stats()[Character.FULL_HEALTH]
+
+        # Playing the level:
+        self.player.get_rect().move_ip(300, 200)
+        self.player.collider.move_ip(300, 200)
+        self.level.move_tile(self.player)
+        self.player.get_stats()[Character.CURRENT_HEALTH] -= 10
+        self.enemy.get_rect().move_ip(-150, 50)
+        self.enemy.collider.move_ip(-150, 50)
+        self.level.move_tile(self.enemy)
+        self.enemy.get_stats()[Character.CURRENT_HEALTH] -= 10
+        self.level.remove_tile(self.killed_enemy)
+        self.player.pick_up_item(self.ground_item)
+        self.enemy_item.set_owner(None)
+
+        self.assertTrue(self.level.restore_snapshot())
+
+        # Test data list where each element is a list of 3 elements:
+        #   1. A description of what is checked
+        #   2. The value after the snapshot has been restored
+        #   3. The value expected, which is how the level was before it was played
+        #      (the player is always restored with full health)
+        test_data = [["Player position", self.player.get_rect().topleft, player_position],
+                     ["Player health", self.player.get_stats()[Character.CURRENT_HEALTH], player_full_health],
+                     ["Enemy position", self.enemy.get_rect().topleft, enemy_position],
+                     ["Enemy health", self.enemy.get_stats()[Character.CURRENT_HEALTH], enemy_health],
+                     ["Enemy in vulnerable grid", self.enemy in self.level.vulnerable_grid, True],
+                     ["Enemy found at its position", self.enemy in self.level.dynamic_grid.query(
+                         self.enemy.get_rect()), True],
+                     ["Killed enemy is hostile", self.killed_enemy in self.level.hostile_tiles, True],
+                     ["Killed enemy in dynamic grid", self.killed_enemy in self.level.dynamic_grid, True],
+                     ["Ground item owner", self.ground_item.get_owner(), None],
+                     ["Ground item on the ground", self.ground_item in self.level.item_tiles, True],
+                     ["Ground item in dynamic grid", self.ground_item in self.level.dynamic_grid, True],
+                     ["Ground item in inventory", self.ground_item in self.player.get_inventory(), False],
+                     ["Enemy item owner", self.enemy_item.get_owner(), self.enemy],
+                     ["Enemy item on the ground", self.enemy_item in self.level.item_tiles, False],
+                     ["Enemy item in dynamic grid", self.enemy_item in self.level.dynamic_grid, False],
+                     ]
+
+        print("\n\033[1mUnit Test for Level.restore_snapshot():")
+        for index, test in enumerate(test_data):
+            print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test[0]} :", end="\t\t")
+            self.assertEqual(test[1], test[2])
+            print(f"\033[92m\033[1mPassed")
+
+
+# A tile with only a rectangle, which is all that the spatial grid needs:
+class GridTile:
+
+    def __init__(self, name, rect):
+        self.name = name
+        self.rect = pygame.Rect(rect)
+
+    def get_rect(self):
+        return self.rect
+
+    def __repr__(self):
+        return self.name
+
+
+class TestSpatialGrid(unittest.TestCase):
+
+    def setUp(self):
+        # A grid with cells of 100x100 pixels, and tiles placed inside cells, on the edges of cells and across them:
+        self.grid = SpatialGrid(100)
+        self.tiles = {name: GridTile(name, rect) for name, rect in [("a", (10, 10, 20, 20)),
+                                                                    ("b", (90, 90, 20, 20)),
+                                                                    ("c", (100, 0, 100, 100)),
+                                                                    ("d", (-150, -50, 40, 40)),
+                                                                    ("e", (250, 250, 300, 30))]}
+        for tile in self.tiles.values(): self.grid.insert(tile)
+
+    def query(self, rect):
+        return [tile.name for tile in self.grid.query(pygame.Rect(rect))]
+
+    def test_query(self):
+        # Testing that exactly the tiles colliding with an area are found, in the order they were inserted,
+        # including tiles that are in more than one cell:
+
+        # Test data list where each element is a list of 2 elements:
+        #   1. The rectangle that the grid is queried with
+        #   2. The names of the tiles expected to be found
+        test_data = [[(0, 0, 50, 50), ["a"]],
+                     [(0, 0, 200, 200), ["a", "b", "c"]],
+                     [(95, 95, 10, 10), ["b", "c"]],
+                     [(100, 100, 10, 10), ["b"]],
+                     [(110, 110, 10, 10), []],
+                     [(199, 99, 1, 1), ["c"]],
+                     [(200, 0, 50, 50), []],
+                     [(-200, -200, 100, 200), ["d"]],
+                     [(500, 260, 10, 10), ["e"]],
+                     [(-1000, -1000, 2000, 2000), ["a", "b", "c", "d", "e"]],
+                     ]
+
+        print("\n\033[1mUnit Test for SpatialGrid.query():")
+        for index, test in enumerate(test_data):
+            print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test} :", end="\t\t")
+            self.assertEqual(self.query(test[0]), test[1])
+            print(f"\033[92m\033[1mPassed")
+
+    def test_move(self):
+        # Testing that tiles are found where they have moved to, and not where they were,
+        # whether or not they have moved into different cells:
+
+        # Test data list where each element is a list of 4 elements:
+        #   1. The name of the tile to move
+        #   2. The new top left position of the tile
+        #   3. The rectangle that the grid is queried with after moving the tile
+        #   4. The names of the tiles expected to be found
+        test_data = [["a", (40, 40), (0, 0, 100, 100), ["a", "b"]],
+                     ["a", (140, 340), (0, 0, 100, 100), ["b"]],
+                     ["a", (140, 340), (100, 300, 100, 100), ["a"]],
+                     ["b", (-120, -20), (-150, -50, 100, 100), ["b", "d"]],
+                     ["b", (-120, -20), (0, 0, 200, 200), ["a", "c"]],
+                     ["e", (0, 0), (0, 0, 50, 50), ["a", "e"]],
+                     ["e", (0, 0), (250, 250, 300, 30), []],
+                     ]
+
+        print("\n\033[1mUnit Test for SpatialGrid.move():")
+        for index, test in enumerate(test_data):
+            print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test} :", end="\t\t")
+            # Resetting the grid, so that each test only moves one tile:
+            self.setUp()
+            tile = self.tiles[test[0]]
+            tile.rect.topleft = test[1]
+            self.grid.move(tile)
+            self.assertEqual(self.query(test[2]), test[3])
+            print(f"\033[92m\033[1mPassed")
+
+    def test_remove(self):
+        # Testing that removed tiles are no longer found in any of the cells they were in,
+        # and that removing a tile that is not in the grid does nothing:
+        print("\n\033[1mUnit Test for SpatialGrid.remove():")
+        for name in ["c", "e", "c"]:
+            print(f"\tRemoving {name} :", end="\t\t")
+            self.grid.remove(self.tiles[name])
+            self.assertNotIn(self.tiles[name], self.grid)
+            self.assertNotIn(name, self.query((-1000, -1000, 2000, 2000)))
+            print(f"\033[92m\033[1mPassed")
+
+        self.assertEqual(self.query((-1000, -1000, 2000, 2000)), ["a", "b", "d"])
+        self.assertEqual(len(self.grid), 3)
+        # Empty cells are not kept:
+        self.assertTrue(all(len(cell) > 0 for cell in self.grid.cells.values()))
+
+
+class TestTriggerGrid(unittest.TestCase):
+
+    def setUp(self):
+        # A trigger volume that records how many times it has been entered and left, in a grid with 100x100 cells,
+        # placed across the edges of cells:
+        self.grid = TriggerGrid(100)
+        self.volume = pygame.Rect(150, 150, 100, 100)
+        self.entered = 0
+        self.left = 0
+        self.grid.add("volume", lambda: self.volume, on_enter=self.enter, on_exit=self.leave)
+
+        # The tile that walks through the volume:
+        self.tile = GridTile("tile", (0, 0, 20, 20))
+
+    def enter(self, tile):
+        self.entered += 1
+
+    def leave(self, tile):
+        self.left += 1
+
+    def test_enter_and_leave(self):
+        # Testing that entering a volume calls its enter function once, however long the tile stays in it,
+        # and that leaving it calls its exit function once, so that entering it again calls the enter function again:
+
+        # Test data list where each element is a list of 3 elements:
+        #   1. The top left position the tile moves to
+        #   2. The number of times the volume is expected to have been entered so far
+        #   3. The number of times the volume is expected to have been left so far
+        test_data = [[(0, 0), 0, 0],
+                     [(120, 120), 0, 0],
+                     [(140, 140), 1, 0],
+                     [(160, 160), 1, 0],
+                     [(230, 230), 1, 0],
+                     [(250, 250), 1, 1],
+                     [(400, 400), 1, 1],
+                     [(200, 100), 1, 1],
+                     [(200, 140), 2, 1],
+                     [(-200, -200), 2, 2],
+                     ]
+
+        print("\n\033[1mUnit Test for TriggerGrid.update():")
+        for index, test in enumerate(test_data):
+            print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test} :", end="\t\t")
+            self.tile.rect.topleft = test[0]
+            self.grid.update(self.tile, self.tile.rect)
+            self.assertEqual((self.entered, self.left), (test[1], test[2]))
+            # The tile is only recorded as being in the volume between entering and leaving it:
+            self.assertEqual("volume" in self.grid.triggers_entered[self.tile], test[1] > test[2])
+            print(f"\033[92m\033[1mPassed")
+
+    def test_remove_and_move(self):
+        # Testing that a volume removed whilst the tile is in it, such as an item that has been picked up,
+        # is forgotten without being left, and that a volume is found where it has moved to:
+        self.tile.rect.topleft = (200, 200)
+        self.grid.update(self.tile, self.tile.rect)
+        self.grid.remove("volume")
+        self.assertNotIn("volume", self.grid)
+        self.assertEqual(len(self.grid.triggers_entered[self.tile]), 0)
+
+        self.tile.rect.topleft = (0, 0)
+        self.grid.update(self.tile, self.tile.rect)
+        self.assertEqual((self.entered, self.left), (1, 0))
+
+        self.grid.add("volume", lambda: self.volume, on_enter=self.enter, on_exit=self.leave)
+        self.volume.topleft = (500, 500)
+        self.grid.move("volume")
+        self.grid.update(self.tile, self.tile.rect)
+        self.assertEqual((self.entered, self.left), (1, 0))
+        self.tile.rect.topleft = (510, 590)
+        self.grid.update(self.tile, self.tile.rect)
+        self.assertEqual((self.entered, self.left), (2, 0))
+
+
+class TestRectExitPoints(unittest.TestCase):
+
+    def test_get_rect_exit_points(self):
+        # Testing that the points at which lines from the centre of the screen to targets leave the screen are found
+        # on the correct edge, and that targets on-screen do not have a point:
+
+        # The screen, with the start point at its centre:
+        rect = pygame.Rect(0, 0, 200, 100)
+        start = rect.center
+
+        # Test data list where each element is a list of 2 elements:
+        #   1. The position of the target
+        #   2. The point at which the line to the target leaves the screen, or None if the target is on-screen
+        test_data = [[(500, 50), (200, 50)],
+                     [(-300, 50), (0, 50)],
+                     [(100, -400), (100, 0)],
+                     [(100, 600), (100, 100)],
+                     [(250, -250), (125, 0)],
+                     [(0, 300), (80, 100)],
+                     [(300, 150), (200, 100)],
+                     [(150, 80), None],
+                     [(200, 100), (200, 100)],
+                     [(100, 50), None],
+                     ]
+
+        print("\n\033[1mUnit Test for get_rect_exit_points():")
+        for index, test in enumerate(test_data):
+            print(f"\tTest {index + 1} of {len(test_data)} \t{'%30s' % test} :", end="\t\t")
+            points = get_rect_exit_points(start, [test[0]], rect).tolist()
+            self.assertEqual(points, [] if test[1] is None else [list(test[1])])
+            print(f"\033[92m\033[1mPassed")
+
+        # All of the targets are handled at once, keeping the order of those that are off-screen:
+        points = get_rect_exit_points(start, [test[0] for test in test_data], rect).tolist()
+        self.assertEqual(points, [list(test[1]) for test in test_data if test[1] is not None])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -82,6 +82,13 @@ class View(ABC, pygame.sprite.Sprite):
         self.to_right_of = to_right_of
         self.between = between
 
+        # In dirty rectangle mode, views are only drawn again when what they look like has changed.
+        # The state the view was drawn with, the area it was drawn in,
+        # and the number of times the whole screen had been redrawn when it was drawn:
+        self.drawn_state = None
+        self.drawn_rect = None
+        self.drawn_redraw_count = None
+
         self.set_size(size)
 
     def set_size(self, size):
@@ -251,8 +258,45 @@ class View(ABC, pygame.sprite.Sprite):
         elif self.frame_condition == self.ALWAYS:
             self.draw_frame(self.frame_colour)
 
+    def get_draw_state(self):
+        # Everything that affects what the view looks like when drawn:
+        # Extended by children that have more to draw:
+        return (self.visible, tuple(self.rect), self.hovering(), self.frame_condition, self.frame_colour,
+                self.frame_hover_colour, self.frame_thickness, self.corner_radius)
+
+    def get_draw_rect(self):
+        # The area of the screen that drawing the view can change:
+        return self.rect.copy()
+
+    def invalidate(self):
+        # Causing the view to be drawn again in the next frame, as if the whole screen had been redrawn:
+        self.drawn_redraw_count = None
+
+    def redraw(self):
+        # Draws the view only if it has changed since it was last drawn, returning whether it was drawn.
+        # If the whole screen has been redrawn since, it needs to be drawn regardless:
+        screen_redrawn = self.drawn_redraw_count != self.game.get_redraw_count()
+        draw_state = self.get_draw_state()
+        if not screen_redrawn and draw_state == self.drawn_state: return False
+
+        # Clearing what was drawn previously, unless the whole screen has been redrawn:
+        if not screen_redrawn and self.drawn_rect is not None:
+            self.game.clear_rect(self.drawn_rect)
+
+        if self.visible:
+            self.draw()
+            self.drawn_rect = self.get_draw_rect()
+            self.game.add_dirty_rect(self.drawn_rect)
+        else:
+            self.drawn_rect = None
+
+        self.drawn_state = draw_state
+        self.drawn_redraw_count = self.game.get_redraw_count()
+        return True
+
     def update(self):
-        if self.visible: self.draw()
+        if self.game.is_dirty_rect_mode(): self.redraw()
+        elif self.visible: self.draw()
 
 
 # A single line of text: [TESTED & FINALISED]
@@ -374,6 +418,10 @@ class TextLine(View):
         # Setting size again since it has changed:
         self.set_size(self.game.pixel_to_unit_point(self.text_surface.get_size()))
 
+    def get_draw_state(self):
+        return super().get_draw_state() + (self.text, self.font_size, self.text_colour, self.text_hover_colour,
+                                           self.font.get_bold(), self.font.get_italic(), self.font.get_underline())
+
     def draw_text(self, colour):
         # Rendering again to obtain the correct colour:
         self.text_surface = self.font.render(self.text, True, colour)
@@ -456,6 +504,9 @@ class Image(View):
             self.max_icon_size = size
             self.update_icon_size()
 
+    def get_draw_state(self):
+        return super().get_draw_state() + (self.icon, tuple(self.icon_rect))
+
     def draw_icon(self):
         self.display.blit(self.icon, self.icon_rect)
 
@@ -670,6 +721,9 @@ class TextInput(TextLine):
         return ((not self.hovering()) and self.game.mouse_released()) \
                or pygame.K_RETURN in self.game.get_key_down_events()
 
+    def get_draw_state(self):
+        return super().get_draw_state() + (self.in_focus,)
+
     def draw(self):
         if self.in_focus:
             # If in focus, drawing with focus colours:
@@ -913,6 +967,16 @@ class Text(View):
             # Updating the position of the individual text surfaces:
             self.position_texts()
 
+    def get_draw_state(self):
+        return super().get_draw_state() + (self.text_alignment,)
+
+    def redraw(self):
+        drawn = super().redraw()
+        # Drawing the view clears the area the text lines are in, so they need to be drawn again:
+        if drawn:
+            for text_line in self.text_lines: text_line.invalidate()
+        return drawn
+
     def update(self):
         super().update()
         for text_line in self.text_lines:
@@ -1030,6 +1094,16 @@ class Slider(View):
         return ((self.handle_position[0] - mouse_pos[0]) ** 2 + (
                 self.handle_position[1] - mouse_pos[1]) ** 2) ** 0.5 <= self.handle_radius
 
+    def get_draw_state(self):
+        return super().get_draw_state() + (tuple(self.bar_rect), tuple(self.handle_position), self.bar_colour,
+                                           self.handle_colour, self.handle_hover_colour, self.handle_radius)
+
+    def get_draw_rect(self):
+        # The handle can extend outside the slider if there is not enough padding:
+        handle_rect = pygame.Rect(0, 0, 2 * self.handle_radius + 1, 2 * self.handle_radius + 1)
+        handle_rect.center = self.handle_position
+        return self.rect.union(handle_rect)
+
     def draw(self):
         # Drawing frame:
         super().draw()
@@ -1142,6 +1216,15 @@ class ProgressBar(View):
     def draw_progress(self):
         pygame.draw.rect(self.display, self.progress_colour, self.bar_rect, border_radius=self.corner_radius)
 
+    def get_draw_state(self):
+        return super().get_draw_state() + (tuple(self.bar_rect), self.progress_colour)
+
+    def redraw(self):
+        drawn = super().redraw()
+        # Drawing the view clears the area the progress text is in, so it needs to be drawn again:
+        if drawn: self.progress_text.invalidate()
+        return drawn
+
     def draw(self):
         super().draw()
         self.draw_progress()
@@ -1149,3 +1232,47 @@ class ProgressBar(View):
     def update(self):
         super().update()
         self.progress_text.update()
+
+
+# A map with markers showing the positions of points of interest:
+class Minimap(Image):
+
+    def __init__(self, game, map_image, map_size, marker_radius=0.004, size=(0.2, 0.2), visible=True,
+                 position=(0, 0), above=None, below=None, to_right_of=None, to_left_of=None, between=None,
+                 margin=0.02, padding=0,
+                 frame_condition=View.ALWAYS, frame_thickness=0.003, corner_radius=0,
+                 frame_colour=BLACK, frame_hover_colour=None):
+        # The size of the map in pixels, used to convert map positions to positions on the minimap:
+        self.map_size = map_size
+
+        # A list of (map position, colour) pairs that should be shown on the minimap:
+        self.markers = []
+        self.marker_radius = game.unit_to_pixel(marker_radius)
+
+        super().__init__(game, map_image, size=size, visible=visible,
+                         position=position, above=above, below=below, to_right_of=to_right_of, to_left_of=to_left_of,
+                         between=between, margin=margin, padding=padding,
+                         frame_condition=frame_condition, frame_thickness=frame_thickness, corner_radius=corner_radius,
+                         frame_colour=frame_colour, frame_hover_colour=frame_hover_colour)
+
+    def set_map(self, map_image, map_size):
+        self.map_size = map_size
+        self.set_icon(map_image)
+
+    def set_markers(self, markers):
+        self.markers = markers
+
+    def get_draw_state(self):
+        return super().get_draw_state() + (tuple(self.markers),)
+
+    def draw_markers(self):
+        # The map image is scaled to fit the minimap, so the positions need to be scaled by the same amount:
+        scale = self.icon_rect.width / self.map_size[0]
+
+        for (x, y), colour in self.markers:
+            pygame.draw.circle(self.display, colour, (self.icon_rect.left + x * scale, self.icon_rect.top + y * scale),
+                               self.marker_radius)
+
+    def draw(self):
+        super().draw()
+        self.draw_markers()
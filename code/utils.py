@@ -1,4 +1,5 @@
 import pygame
+import numpy as np
 from os import walk
 from strings import *
 from assets import *
@@ -10,9 +11,9 @@ def percentage_format(float_value):
     return "{}%".format(round(float_value * 100))
 
 
-# Places all image surfaces in a directory into a list:
-def import_images(folder_path):
-    images = []
+# Places the paths of all image files in a directory into a list:
+def get_image_paths(folder_path):
+    image_paths = []
 
     for _, __, image_files in walk(folder_path):
         # Iterable contains a tuple with the following items:
@@ -22,12 +23,14 @@ def import_images(folder_path):
 
         for image_file in image_files:
             # The full path of image:
-            full_path = folder_path + "/" + image_file
+            image_paths.append(folder_path + "/" + image_file)
 
-            image_surface = pygame.image.load(full_path).convert_alpha()
-            images.append(image_surface)
+    return image_paths
 
-    return images
+
+# Places all image surfaces in a directory into a list:
+def import_images(folder_path):
+    return [pygame.image.load(image_path).convert_alpha() for image_path in get_image_paths(folder_path)]
 
 
 # Resizes an image whilst protecting the aspect ratio:
@@ -48,25 +51,96 @@ def resize_image(image, size):
     return pygame.transform.scale(image, (width, height))
 
 
+# Scaled images shared between all the tiles that use the same source image,
+# by image id, size and whether the aspect ratio was protected:
+scaled_images = {}
+
+
+# Returns a scaled version of an image.
+# If an image id is provided, the result is shared between all calls with the same arguments,
+# so identical tiles do not each need their own copy of the image.
+# If an asset pack is also provided, the scaled image is taken from the pack, or added to it.
+# The image can be a function that returns the image, so that it is only loaded if it needs to be scaled:
+def get_scaled_image(image, size, protect_aspect_ratio=True, image_id=None, asset_pack=None):
+    key = (image_id, tuple(size), protect_aspect_ratio)
+    if image_id is not None and key in scaled_images: return scaled_images[key]
+
+    # The pack key includes every part of the key, since stretched and aspect-protected images differ:
+    pack_key = "scaled:{}:{}:{}".format(*key)
+    if image_id is not None and asset_pack is not None:
+        packed_images = asset_pack.get(pack_key)
+        if packed_images is not None:
+            scaled_images[key] = packed_images[0]
+            return packed_images[0]
+
+    if callable(image): image = image()
+
+    if protect_aspect_ratio:
+        # Resizing the image whilst protecting the aspect ratio:
+        scaled_image = resize_image(image, size)
+    else:
+        # Resizing the image without protecting the aspect ratio:
+        scaled_image = pygame.transform.scale(image, size)
+
+    if image_id is not None:
+        scaled_images[key] = scaled_image
+        if asset_pack is not None: asset_pack.add(pack_key, [scaled_image])
+    return scaled_image
+
+
+# Masks of the opaque pixels of images, shared between all the tiles that use the same scaled image:
+image_masks = {}
+
+
+# Returns the mask of an image, which is only created the first time it is needed:
+def get_image_mask(image):
+    if image not in image_masks: image_masks[image] = pygame.mask.from_surface(image)
+    return image_masks[image]
+
+
+# Blank images by size, shared between all the tiles that do not have an image of their own yet:
+blank_images = {}
+
+
+def get_blank_image(size):
+    size = tuple(size)
+    if size not in blank_images: blank_images[size] = pygame.Surface(size)
+    return blank_images[size]
+
+
+# Completely filled masks by size, used to check rectangles against the masks of images:
+filled_masks = {}
+
+
+def get_filled_mask(size):
+    size = tuple(size)
+    if size not in filled_masks: filled_masks[size] = pygame.mask.Mask(size, fill=True)
+    return filled_masks[size]
+
+
 # A simple function that just returns the range of a numeric iterable:
 def get_range(values):
     return max(values) - min(values)
 
 
-# An algorithm that returns the intersection point of two line segments:
-def get_segment_intersection(points1, points2):
-    (x1, y1), (x2, y2) = points1
-    (x3, y3), (x4, y4) = points2
-
-    denominator = ((x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4))
-
-    if denominator == 0: return None
+# Returns the points at which the line segments from a start point inside a rectangle to each of the target points
+# leave the rectangle. All segments are handled at once, and those whose targets are inside the rectangle are left out:
+def get_rect_exit_points(start, targets, rect):
+    start = np.asarray(start, dtype=float)
+    directions = np.asarray(targets, dtype=float).reshape(-1, 2) - start
 
-    t = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / denominator
+    # The distance along each segment (as a proportion of its length) at which it reaches the side of the rectangle
+    # it is heading towards, both horizontally and vertically. Segments that do not move along an axis never leave:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sides = np.where(directions > 0, (rect.right, rect.bottom), (rect.left, rect.top))
+        exit_proportions = (sides - start) / directions
+    exit_proportions[directions == 0] = np.inf
 
-    if not 0 <= t <= 1: return None
+    # Each segment leaves through whichever side it reaches first, which is only on the segment if it is within 1:
+    exit_proportion = exit_proportions.min(axis=1)
+    leaving = exit_proportion <= 1
 
-    return x1 + t * (x2 - x1), y1 + t * (y2 - y1)
+    return start + directions[leaving] * exit_proportion[leaving, np.newaxis]
 
 
 # Returns True or False. Chance to return True is passed as the argument: